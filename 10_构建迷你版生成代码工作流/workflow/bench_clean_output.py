@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM输出清理耗时对比
+
+正则清理: 原 clean_output 的两次全文正则替换（输出全部到达后执行）
+流式清理: StreamingOutputCleaner 按 64 字符的块逐块处理（模拟边生成边清理）
+
+分别在不同大小的合成输出上测量，观察耗时是否随输入大小线性增长：
+  normal   : 普通推理模型输出（think 块 + 代码 + 空行）
+  unclosed : 大量未闭合的 <think>（正则从每个开标签扫描到末尾）
+  spaces   : 只含两个换行的长空白段（空行合并正则反复回溯）
+用法: python bench_clean_output.py [最大MB数]
+"""
+
+import re
+import sys
+import time
+
+from main import StreamingOutputCleaner
+
+CHUNK_SIZE = 64
+
+
+def regex_clean(output: str) -> str:
+    output = re.sub(r'<think>.*?</think>', '', output, flags=re.DOTALL | re.IGNORECASE)
+    output = re.sub(r'\n\s*\n\s*\n', '\n\n', output)
+    return output.strip()
+
+
+def streaming_clean(output: str) -> str:
+    cleaner = StreamingOutputCleaner()
+    parts = [cleaner.feed(output[i:i + CHUNK_SIZE]) for i in range(0, len(output), CHUNK_SIZE)]
+    parts.append(cleaner.finish())
+    return "".join(parts)
+
+
+def make_output(kind: str, size: int) -> str:
+    """生成约 size 字符的合成输出"""
+    if kind == "normal":
+        unit = ("<think>先分析需求，再设计接口。\n\n\n考虑分页与校验。</think>\n"
+                "public class UserController {\n    // 查询用户\n\n\n\n    public Result list() {}\n}\n\n\n")
+    elif kind == "unclosed":
+        unit = "<think>分析中 " + "x" * 50 + "\n"
+    else:
+        unit = "a\n" + " " * 200 + "\n" + " " * 200
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+def measure(func, text: str) -> float:
+    start = time.perf_counter()
+    func(text)
+    return time.perf_counter() - start
+
+
+def main():
+    max_mb = float(sys.argv[1]) if len(sys.argv) > 1 else 4
+    sizes = [int(mb * 1024 * 1024) for mb in (0.25, 0.5, 1, 2, 4, 8, 16) if mb <= max_mb]
+
+    for kind in ("normal", "unclosed", "spaces"):
+        print(f"\n[{kind}]")
+        print(f"{'大小':>8} {'正则清理':>12} {'流式清理':>12} {'流式 MB/s':>10}")
+        for size in sizes:
+            text = make_output(kind, size)
+            # 未闭合标签场景下正则耗时随大小平方增长（1MB 约需数分钟），超过 0.5MB 时跳过
+            if kind == "unclosed" and size > 512 * 1024:
+                regex_time = None
+            else:
+                regex_time = measure(regex_clean, text)
+            streaming_time = measure(streaming_clean, text)
+            regex_text = f"{regex_time:.3f}s" if regex_time is not None else "跳过"
+            print(f"{size / 1024 / 1024:>6.2f}MB {regex_text:>12} {streaming_time:>11.3f}s "
+                  f"{size / 1024 / 1024 / streaming_time:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+LLM客户端复用的单步开销对比
+
+在本地启动一个兼容 OpenAI 接口的桩服务器（立即返回固定内容），
+分别测量每步新建 LLM 实例（create_llm）与复用连接池（get_llm）时的单步耗时。
+用法: python bench_llm_pool.py [步骤数]
+"""
+
+import sys
+import json
+import time
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from langchain_core.messages import HumanMessage
+
+from main import LLMConfig, LLMFactory
+
+RESPONSE_BODY = json.dumps({
+    "id": "chatcmpl-bench",
+    "object": "chat.completion",
+    "created": 0,
+    "model": "bench",
+    "choices": [{
+        "index": 0,
+        "message": {"role": "assistant", "content": "ok"},
+        "finish_reason": "stop"
+    }],
+    "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+}).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """OpenAI chat/completions 桩接口"""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def run_steps(config: LLMConfig, steps: int, pooled: bool) -> float:
+    """顺序执行若干步骤，返回平均单步耗时（毫秒）"""
+    messages = [HumanMessage(content="ping")]
+    start = time.perf_counter()
+    for _ in range(steps):
+        llm = LLMFactory.get_llm(config) if pooled else LLMFactory.create_llm(config)
+        await llm.ainvoke(messages)
+    elapsed = time.perf_counter() - start
+    await LLMFactory.aclose_all()
+    return elapsed / steps * 1000
+
+
+async def main():
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    config = LLMConfig(
+        name="bench",
+        provider="deepseek",
+        model="bench",
+        base_url=f"http://127.0.0.1:{server.server_port}/v1",
+        api_key="bench"
+    )
+
+    try:
+        per_step_new = await run_steps(config, steps, pooled=False)
+        per_step_pooled = await run_steps(config, steps, pooled=True)
+    finally:
+        server.shutdown()
+
+    print(f"步骤数: {steps}")
+    print(f"每步新建实例: {per_step_new:.2f} ms/步")
+    print(f"复用连接池  : {per_step_pooled:.2f} ms/步")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
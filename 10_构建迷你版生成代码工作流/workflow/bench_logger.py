@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+日志写入开销对比
+
+逐条写入: 每条日志打开、追加、关闭文件（原 Logger 的做法）
+缓冲写入: Logger 放入缓冲区，由后台任务批量写入
+同时统计记录日志期间事件循环被阻塞的最长时间。
+用法: python bench_logger.py [日志条数]
+"""
+
+import sys
+import json
+import time
+import asyncio
+import tempfile
+from datetime import datetime
+from pathlib import Path
+
+from main import Logger
+
+
+async def measure_loop_lag(stop: asyncio.Event, interval: float = 0.001) -> float:
+    """测量事件循环的最大调度延迟（秒）"""
+    max_lag = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        max_lag = max(max_lag, time.perf_counter() - start - interval)
+    return max_lag
+
+
+async def log_unbuffered(log_file: Path, count: int):
+    for i in range(count):
+        log_entry = {
+            "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "level": "INFO",
+            "message": f"entry {i}"
+        }
+        with open(log_file, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+
+
+async def log_buffered(logger: Logger, count: int):
+    for i in range(count):
+        logger.log_message(f"entry {i}")
+        if i % 100 == 0:
+            await asyncio.sleep(0)
+    await logger.aclose()
+
+
+async def run(name: str, coro_factory) -> None:
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(measure_loop_lag(stop))
+    start = time.perf_counter()
+    await coro_factory()
+    elapsed = time.perf_counter() - start
+    stop.set()
+    max_lag = await lag_task
+    print(f"{name}: 总耗时 {elapsed:.2f}s, 事件循环最大阻塞 {max_lag * 1000:.1f} ms")
+
+
+async def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        log_file = Path(tmp_dir) / "unbuffered.log"
+        logger = Logger(tmp_dir, flush_interval=0.05)
+
+        print(f"日志条数: {count}")
+        await run("逐条写入", lambda: log_unbuffered(log_file, count))
+        await run("缓冲写入", lambda: log_buffered(logger, count))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -8,14 +8,23 @@
 import os
 import json
 import re
+import copy
+import atexit
+import csv
+import random
+import hashlib
+import threading
+import argparse
+import contextlib
 
 import yaml
 import time
 import asyncio
+import httpx
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional, Any
-from dataclasses import dataclass
+from typing import Dict, List, Optional, Any, Tuple
+from dataclasses import dataclass, field, asdict, replace
 from enum import Enum
 
 from langchain_openai import ChatOpenAI
@@ -23,6 +32,9 @@ from langchain_ollama import ChatOllama
 from langchain_core.messages import HumanMessage
 from langchain_core.prompts import ChatPromptTemplate
 
+# 与 8_全栈神器AI批量代码生成模块 共用仓库根目录下的 common 包，运行时需将仓库根目录加入 PYTHONPATH
+from common.code_files import split_code_blocks, write_files, safe_join
+
 
 class LLMProvider(Enum):
     OPENAI = "openai"
@@ -64,6 +76,19 @@ class StepConfig:
     prompt_template: str
     context_type: Optional[str] = None
     depends_on: List[str] = None
+    # 上下文的token预算，超出时按与需求的相关度截断或丢弃示例文件
+    context_token_budget: Optional[int] = None
+    # 只需要上游部分输出的依赖（流式模式下可提前开始），上游步骤名 -> 以下任一形式：
+    #   整数: 需要的输出字符数（取前这么多字符，并截断到其中最后一个换行处）
+    #   {"section": "标题"}: 该 Markdown 标题下的章节（出现下一个同级或更高级标题时视为完整）
+    #   {"pattern": "正则"}: 正则首次匹配的内容（有分组时取第1组），正则应包含结束标志
+    prefix_depends_on: Dict[str, Any] = None
+    # 主LLM失败（重试耗尽或熔断）后依次尝试的备用LLM配置名
+    fallback_llm_names: List[str] = None
+    # 单个LLM的最大重试次数，未配置时使用工作流的 max_retries
+    max_retries: Optional[int] = None
+    # 加载配置时预编译的提示模板
+    compiled_prompt: Optional[ChatPromptTemplate] = field(default=None, repr=False)
 
 
 @dataclass
@@ -76,6 +101,39 @@ class WorkflowConfig:
     requirement: str = "开发一个文章管理系统，包含文章的增删改查功能"  # 首个流程节点需要，具体开发需求
     output_dir: str = "./output"
     log_dir: str = "./logs"
+    # 每个LLM提供商允许同时执行的步骤数，未配置的提供商使用 default_concurrency
+    provider_concurrency: Dict[str, int] = field(default_factory=dict)
+    default_concurrency: int = 2
+    # 步骤结果缓存：提示词与LLM配置不变时直接复用上次输出
+    cache_dir: str = "./.cache"
+    cache_max_size_mb: int = 200
+    use_cache: bool = True
+    # 断点目录：每个步骤完成后保存结果，可通过 --resume <run_id> 继续执行
+    checkpoint_dir: str = "./checkpoints"
+    # 流式模式：使用 astream 边生成边写入输出文件
+    stream: bool = False
+    # 安静模式：不打印输入数据、提示词和模型输出等大段调试信息
+    quiet: bool = False
+    # 重试：超时、限流、5xx等可重试错误按指数退避（带随机抖动）重试
+    max_retries: int = 2
+    retry_base_delay: float = 1.0
+    retry_max_delay: float = 30.0
+    # 熔断：同一提供商连续失败达到阈值后暂停调用，冷却时间后放行一次试探请求
+    circuit_failure_threshold: int = 5
+    circuit_reset_timeout: float = 60.0
+
+
+@dataclass
+class StepMetrics:
+    """步骤性能指标（时间单位：秒）"""
+    start_time: float = 0.0
+    end_time: float = 0.0
+    queue_wait: float = 0.0
+    prompt_build_time: float = 0.0
+    llm_latency: float = 0.0
+    input_tokens: Optional[int] = None
+    output_tokens: Optional[int] = None
+    retries: int = 0
 
 
 @dataclass
@@ -88,13 +146,218 @@ class StepResult:
     timestamp: datetime
     success: bool
     error_message: Optional[str] = None
+    cached: bool = False
+    context_tokens_raw: int = 0
+    context_tokens_packed: int = 0
+    # 首个token的延迟（秒），仅流式模式下记录
+    first_token_latency: Optional[float] = None
+    # 实际产生输出的LLM配置名（发生故障转移时与 StepConfig.llm_name 不同）
+    llm_name: Optional[str] = None
+    metrics: StepMetrics = field(default_factory=StepMetrics)
+
+
+_CJK_PATTERN = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]')
+_WORD_PATTERN = re.compile(r'[A-Za-z_][A-Za-z0-9_]{2,}')
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算token数：中日韩字符按1个token计，其余字符按4个字符1个token计"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + (len(text) - cjk_count + 3) // 4
+
+
+_HEADING_PATTERN = re.compile(r'^(#{1,6})[ \t]+(.*?)[ \t#]*$', re.MULTILINE)
+_FENCE_PATTERN = re.compile(r'^ {0,3}(`{3,}|~{3,})(.*)$')
+
+
+class _PartialOutputSelector:
+    """从（可能未完成的）上游输出中增量地选取依赖的部分
+
+    上游每产生一个片段都会唤醒等待者，这里只在新的完整行到达时检查，
+    章节模式下每行只扫描一次，避免每个片段都对全部内容重新匹配。
+
+    Args:
+        spec: {"section": 标题} 或 {"pattern": 正则}
+    """
+
+    def __init__(self, spec: Dict[str, str]):
+        self.spec = spec
+        self.reset()
+
+    def reset(self):
+        """丢弃已接收的内容（上游重试或替换输出时调用）"""
+        self._parts: List[str] = []
+        self._line_parts: List[str] = []
+        self._section: Optional[List[str]] = None
+        self._level = 0
+        # 当前所在代码块的开始标记，代码块内的 # 注释不是标题
+        self._fence: Optional[str] = None
+
+    def feed(self, text: str) -> Optional[str]:
+        """接收新到达的内容，条件满足时返回选取结果，否则返回 None"""
+        self._parts.append(text)
+        if "\n" not in text:
+            self._line_parts.append(text)
+            return None
+        head, _, tail = text.rpartition("\n")
+        complete = "".join(self._line_parts) + head + "\n"
+        self._line_parts = [tail] if tail else []
+
+        if "pattern" in self.spec:
+            # 只匹配完整的行，未完成的最后一行可能让贪婪匹配截得过短
+            received = "".join(self._parts)
+            return self._match_pattern(received[:len(received) - len(tail)])
+        for line in complete.splitlines(keepends=True):
+            result = self._feed_line(line)
+            if result is not None:
+                return result
+        return None
+
+    def finish(self) -> str:
+        """上游输出结束时返回选取结果，未匹配时退回完整输出"""
+        text = "".join(self._parts)
+        if "pattern" in self.spec:
+            result = self._match_pattern(text)
+            return text if result is None else result
+
+        if self._line_parts:
+            result = self._feed_line("".join(self._line_parts))
+            self._line_parts = []
+            if result is not None:
+                return result
+        # 章节之后没有出现同级标题时延续到末尾
+        if self._section is not None:
+            return "".join(self._section).rstrip()
+        return text
+
+    def _match_pattern(self, text: str) -> Optional[str]:
+        match = re.search(self.spec["pattern"], text, re.DOTALL)
+        if match:
+            return match.group(1) if match.groups() else match.group(0)
+        return None
+
+    def _feed_line(self, line: str) -> Optional[str]:
+        heading = None
+        fence = _FENCE_PATTERN.match(line.rstrip("\r\n"))
+        if self._fence is not None:
+            # 结束标记须使用相同字符、长度不短于开始标记，且后面没有其他内容
+            if fence and fence.group(1)[0] == self._fence[0] and len(fence.group(1)) >= len(self._fence) \
+                    and not fence.group(2).strip():
+                self._fence = None
+        elif fence:
+            self._fence = fence.group(1)
+        else:
+            heading = _HEADING_PATTERN.match(line)
+        if self._section is None:
+            if heading and self.spec["section"] in heading.group(2):
+                self._section = [line]
+                self._level = len(heading.group(1))
+            return None
+        if heading and len(heading.group(1)) <= self._level:
+            return "".join(self._section).rstrip()
+        self._section.append(line)
+        return None
+
+
+def _extract_usage(message) -> Tuple[Optional[int], Optional[int]]:
+    """从LLM返回消息的 usage_metadata 中读取 (输入token数, 输出token数)"""
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None, None
+    return usage.get("input_tokens"), usage.get("output_tokens")
+
+
+# 可重试的HTTP状态码与异常类型名（openai SDK 的异常类型）
+_RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+_RETRYABLE_ERROR_NAMES = {"APITimeoutError", "APIConnectionError", "RateLimitError", "InternalServerError"}
+
+
+def _is_retryable(error: Exception) -> bool:
+    """判断LLM调用错误是否值得重试"""
+    if isinstance(error, (asyncio.TimeoutError, httpx.TimeoutException, httpx.TransportError, ConnectionError)):
+        return True
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code in _RETRYABLE_STATUS_CODES:
+        return True
+    return type(error).__name__ in _RETRYABLE_ERROR_NAMES
+
+
+class CircuitBreaker:
+    """LLM提供商熔断器
+
+    连续失败达到阈值后进入打开状态，冷却期内直接拒绝调用；
+    冷却结束后放行一次试探调用，成功则恢复，失败则重新打开。
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    def allow(self) -> bool:
+        """是否允许发起调用"""
+        if self._opened_at is None:
+            return True
+        if self._probing or time.time() - self._opened_at < self.reset_timeout:
+            return False
+        # 半开状态：只放行一次试探调用
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self._failures = 0
+        self._opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self._failures += 1
+        if self._probing or self._failures >= self.failure_threshold:
+            self._opened_at = time.time()
+        self._probing = False
+
+    def release(self):
+        """调用没有得出提供商是否可用的结论（被取消、不可重试的错误）时释放试探名额"""
+        self._probing = False
 
 
 class LLMFactory:
     """LLM工厂类"""
 
+    # 按 LLMConfig.name 缓存的LLM实例及其共享的异步HTTP客户端
+    _llm_pool: Dict[str, Any] = {}
+    _http_clients: Dict[str, httpx.AsyncClient] = {}
+
     @staticmethod
-    def create_llm(config: LLMConfig):
+    def get_llm(config: LLMConfig):
+        """获取LLM实例，同名配置复用同一个实例和HTTP连接池"""
+        llm = LLMFactory._llm_pool.get(config.name)
+        if llm is None:
+            http_client = None
+            if config.provider in (LLMProvider.OPENAI.value, LLMProvider.DEEPSEEK.value):
+                http_client = httpx.AsyncClient(timeout=httpx.Timeout(600.0, connect=10.0))
+                LLMFactory._http_clients[config.name] = http_client
+            llm = LLMFactory.create_llm(config, http_async_client=http_client)
+            LLMFactory._llm_pool[config.name] = llm
+        return llm
+
+    @staticmethod
+    async def aclose_all():
+        """关闭工厂创建的HTTP连接（OpenAI/DeepSeek），工作流结束时调用
+
+        ChatOllama 的连接由其内部的 ollama 客户端持有，没有公开的关闭接口，这里不处理，随进程退出释放。
+        """
+        for http_client in LLMFactory._http_clients.values():
+            await http_client.aclose()
+
+        LLMFactory._http_clients.clear()
+        LLMFactory._llm_pool.clear()
+
+    @staticmethod
+    def create_llm(config: LLMConfig, http_async_client: Optional[httpx.AsyncClient] = None):
         """创建LLM实例"""
         if config.provider == LLMProvider.OPENAI.value:
             return ChatOpenAI(
@@ -104,7 +367,9 @@ class LLMFactory:
                 top_p=config.top_p,
                 frequency_penalty=config.frequency_penalty,
                 presence_penalty=config.presence_penalty,
-                api_key=config.api_key or os.getenv("OPENAI_API_KEY")
+                api_key=config.api_key or os.getenv("OPENAI_API_KEY"),
+                http_async_client=http_async_client,
+                stream_usage=True
             )
 
         elif config.provider == LLMProvider.DEEPSEEK.value:
@@ -116,7 +381,9 @@ class LLMFactory:
                 frequency_penalty=config.frequency_penalty,
                 presence_penalty=config.presence_penalty,
                 base_url=config.base_url or "https://api.deepseek.com/v1",
-                api_key=config.api_key or os.getenv("DEEPSEEK_API_KEY")
+                api_key=config.api_key or os.getenv("DEEPSEEK_API_KEY"),
+                http_async_client=http_async_client,
+                stream_usage=True
             )
 
         elif config.provider == LLMProvider.OLLAMA.value:
@@ -131,35 +398,156 @@ class LLMFactory:
 
     @staticmethod
     def clean_output(output: str) -> str:
-        """清理LLM输出内容"""
+        """清理LLM输出内容：移除 <think></think> 块，多个连续空行合并为一个，去掉首尾空白"""
         if not output:
             return output
 
-        # 移除 <think></think> 标签及其内容
-        output = re.sub(r'<think>.*?</think>', '', output, flags=re.DOTALL | re.IGNORECASE)
-
-        # 移除其他可能的内部标签（可根据需要扩展）
-        # output = re.sub(r'<reasoning>.*?</reasoning>', '', output, flags=re.DOTALL | re.IGNORECASE)
-        # output = re.sub(r'<internal>.*?</internal>', '', output, flags=re.DOTALL | re.IGNORECASE)
-
-        # 清理多余的空白字符
-        output = re.sub(r'\n\s*\n\s*\n', '\n\n', output)  # 多个连续空行替换为两个
-        output = output.strip()
-
+        cleaner = StreamingOutputCleaner()
+        return cleaner.feed(output) + cleaner.finish()
+
+
+class StreamingOutputCleaner:
+    r"""流式输出清理器
+
+    逐块处理LLM输出，结果与一次性执行以下处理相同：
+        re.sub(r'<think>.*?</think>', '', output, flags=re.DOTALL | re.IGNORECASE)
+        re.sub(r'\n\s*\n\s*\n', '\n\n', output).strip()
+    每个字符只扫描常数次，整体为线性时间，且不会因未闭合的 <think> 或长空白段产生回溯。
+    未闭合的 <think> 块会一直缓存，结束时按原样输出（与正则不匹配时保留原文一致）。
+    """
+
+    _OPEN_TAG = re.compile(r'<think>', re.IGNORECASE)
+    _CLOSE_TAG = re.compile(r'</think>', re.IGNORECASE)
+    # 块末尾可能是被截断的 <think> 开头
+    _OPEN_TAG_PREFIX = re.compile(r'<(?:t(?:h(?:i(?:n(?:k)?)?)?)?)?\Z', re.IGNORECASE)
+    _WHITESPACE = re.compile(r'\s+')
+
+    def __init__(self):
+        # think 过滤阶段
+        self._pending = ""              # 块外：末尾可能是被截断的 <think> 开头
+        self._in_think = False
+        self._think_parts: List[str] = []  # 块内：从 <think> 开始的全部内容，未闭合时原样输出
+        self._think_tail = ""           # 块内：上一块的末尾，用于查找跨块的 </think>
+        # 空白合并阶段
+        self._whitespace_parts: List[str] = []  # 尚未确定是否结束的空白段
+        self._started = False           # 是否已输出过非空白内容（用于去掉开头空白）
+
+    def feed(self, chunk: str) -> str:
+        """处理一个输出块，返回可以确定输出的清理后内容"""
+        return self._collapse_whitespace(self._filter_think(chunk))
+
+    def finish(self) -> str:
+        """输出结束，返回剩余内容（末尾空白被丢弃）"""
+        remaining = "".join(self._think_parts) if self._in_think else self._pending
+        self._pending = ""
+        self._in_think = False
+        self._think_parts = []
+        self._think_tail = ""
+        output = self._collapse_whitespace(remaining)
+        self._whitespace_parts = []
         return output
 
+    def _filter_think(self, text: str) -> str:
+        """移除已闭合的 <think> 块"""
+        output = []
+
+        while text:
+            if self._in_think:
+                search_text = self._think_tail + text
+                close = self._CLOSE_TAG.search(search_text)
+                if close is None:
+                    self._think_parts.append(text)
+                    self._think_tail = search_text[-(len("</think>") - 1):]
+                    break
+                text = text[close.end() - len(self._think_tail):]
+                self._in_think = False
+                self._think_parts = []
+                self._think_tail = ""
+            else:
+                text = self._pending + text
+                self._pending = ""
+                open_tag = self._OPEN_TAG.search(text)
+                if open_tag is None:
+                    tail = self._OPEN_TAG_PREFIX.search(text, max(0, len(text) - len("<think>") + 1))
+                    end = tail.start() if tail else len(text)
+                    output.append(text[:end])
+                    self._pending = text[end:]
+                    break
+                output.append(text[:open_tag.start()])
+                self._in_think = True
+                self._think_parts = [open_tag.group()]
+                text = text[open_tag.end():]
+
+        return "".join(output)
+
+    def _collapse_whitespace(self, text: str) -> str:
+        """合并含3个及以上换行的空白段，去掉开头空白；末尾空白段留待后续内容确定"""
+        output = []
+        position = 0
+
+        for match in self._WHITESPACE.finditer(text):
+            if match.start() > position:
+                self._flush_whitespace_run(output)
+                output.append(text[position:match.start()])
+                self._started = True
+            self._whitespace_parts.append(match.group())
+            position = match.end()
+
+        if position < len(text):
+            self._flush_whitespace_run(output)
+            output.append(text[position:])
+            self._started = True
+
+        return "".join(output)
+
+    def _flush_whitespace_run(self, output: List[str]):
+        """非空白内容到来时输出之前的空白段"""
+        run = "".join(self._whitespace_parts)
+        self._whitespace_parts = []
+        if not run or not self._started:
+            return
+        first_newline = run.find("\n")
+        if first_newline != -1 and run.count("\n") >= 3:
+            last_newline = run.rfind("\n")
+            run = run[:first_newline] + "\n\n" + run[last_newline + 1:]
+        output.append(run)
+
 
 class ContextManager:
-    """上下文管理器"""
+    """上下文管理器
+
+    上下文在首次使用时才加载，格式化结果按上下文类型缓存；
+    每次获取时只比较文件的 mtime/size，只有发生变化的文件才会重新读取。
+    """
 
     def __init__(self, contexts: Dict[str, ContextConfig]):
         self.contexts = contexts
-        self._load_all_contexts()
+        # 文件路径 -> (文件签名, 内容)
+        self._file_cache: Dict[str, Tuple[Optional[Tuple[int, int]], Optional[str]]] = {}
+        # 上下文类型 -> (上下文签名, 格式化结果)
+        self._formatted_cache: Dict[str, Tuple[tuple, str]] = {}
 
     def _load_all_contexts(self):
-        """加载所有上下文"""
-        for context_name, context_config in self.contexts.items():
-            self._load_context_files(context_config)
+        """预加载所有上下文"""
+        for context_name in self.contexts:
+            self.get_context(context_name)
+
+    @staticmethod
+    def _file_signature(file_path: str) -> Optional[Tuple[int, int]]:
+        """文件签名 (mtime_ns, size)，文件不存在时返回 None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _context_signature(self, context_config: ContextConfig) -> tuple:
+        """上下文涉及的所有文件的签名"""
+        file_paths = []
+        for files in (context_config.example_files, context_config.documentation_files,
+                      context_config.mybatis_files, context_config.configuration_files):
+            file_paths.extend(files or [])
+        return tuple((file_path, self._file_signature(file_path)) for file_path in file_paths)
 
     def _load_context_files(self, context_config: ContextConfig):
         """加载上下文文件"""
@@ -208,7 +596,18 @@ class ContextManager:
                     })
 
     def _load_file_content(self, file_path: str) -> Optional[str]:
-        """加载文件内容"""
+        """加载文件内容，文件签名未变化时直接返回缓存内容"""
+        signature = self._file_signature(file_path)
+        cached = self._file_cache.get(file_path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        content = self._read_file(file_path)
+        self._file_cache[file_path] = (signature, content)
+        return content
+
+    def _read_file(self, file_path: str) -> Optional[str]:
+        """读取文件内容"""
         try:
             file_path = Path(file_path)
             if file_path.exists():
@@ -227,7 +626,103 @@ class ContextManager:
             return ""
 
         context_config = self.contexts[context_type]
-        return self._format_context(context_config)
+        signature = self._context_signature(context_config)
+        cached = self._formatted_cache.get(context_type)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        self._load_context_files(context_config)
+        formatted = self._format_context(context_config)
+        self._formatted_cache[context_type] = (signature, formatted)
+        return formatted
+
+    # 可被打包的文件分组（与 _load_context_files 中设置的属性对应）
+    _PACKABLE_GROUPS = ("examples", "mybatis_examples", "configurations", "documentation")
+    # 每个文件在格式化后额外占用的token（文件名标题、代码块标记等）
+    _FILE_OVERHEAD_TOKENS = 20
+    # 剩余预算低于该值时不再截断放入文件
+    _MIN_SNIPPET_TOKENS = 200
+
+    def pack_context(self, context_type: str, token_budget: Optional[int],
+                     query: str = "") -> Tuple[str, int, int]:
+        """按token预算打包上下文
+
+        文件按与 query 的相关度排序，放得下的完整保留，第一个放不下的截断，其余丢弃。
+
+        Returns:
+            (打包后的上下文, 原始token数, 打包后token数)
+        """
+        full_context = self.get_context(context_type)
+        raw_tokens = estimate_tokens(full_context)
+        if not token_budget or raw_tokens <= token_budget:
+            return full_context, raw_tokens, raw_tokens
+
+        context_config = self.contexts[context_type]
+        header = f"技术框架: {context_config.framework}\n开发要求:\n{context_config.requirements}"
+        # 预留分组标题（"示例代码:" 等）占用的token
+        remaining = token_budget - estimate_tokens(header) - self._FILE_OVERHEAD_TOKENS * 2
+
+        query_terms = self._extract_terms(query)
+        candidates = []
+        for group in self._PACKABLE_GROUPS:
+            for index, item in enumerate(getattr(context_config, group, None) or []):
+                tokens = estimate_tokens(item["content"])
+                score = self._relevance_score(query_terms, item)
+                candidates.append((group, index, item, tokens, score))
+
+        # 相关度高的优先，相关度相同时小文件优先
+        candidates.sort(key=lambda c: (-c[4], c[3]))
+
+        kept: Dict[str, Dict[int, Dict[str, str]]] = {group: {} for group in self._PACKABLE_GROUPS}
+        for group, index, item, tokens, _ in candidates:
+            cost = tokens + self._FILE_OVERHEAD_TOKENS
+            if cost <= remaining:
+                kept[group][index] = item
+                remaining -= cost
+            elif remaining >= self._MIN_SNIPPET_TOKENS:
+                content = self._truncate_to_tokens(item["content"], tokens,
+                                                   remaining - self._FILE_OVERHEAD_TOKENS)
+                kept[group][index] = {"file": item["file"], "content": content}
+                remaining = 0
+
+        packed_config = copy.copy(context_config)
+        for group in self._PACKABLE_GROUPS:
+            if hasattr(context_config, group):
+                # 保持文件原有顺序
+                setattr(packed_config, group, [kept[group][i] for i in sorted(kept[group])])
+
+        packed_context = self._format_context(packed_config)
+        return packed_context, raw_tokens, estimate_tokens(packed_context)
+
+    @staticmethod
+    def _extract_terms(text: str) -> set:
+        """提取用于相关度计算的词：英文标识符（按驼峰拆分）和中文二元组"""
+        terms = set()
+        for word in _WORD_PATTERN.findall(text or ""):
+            terms.add(word.lower())
+            for part in re.findall(r'[A-Z]?[a-z]{3,}', word):
+                terms.add(part.lower())
+        cjk_chars = _CJK_PATTERN.findall(text or "")
+        for i in range(len(cjk_chars) - 1):
+            terms.add(cjk_chars[i] + cjk_chars[i + 1])
+        return terms
+
+    def _relevance_score(self, query_terms: set, item: Dict[str, str]) -> int:
+        """文件与需求的相关度：命中的不同词数量，文件名命中额外加分"""
+        if not query_terms:
+            return 0
+        file_terms = self._extract_terms(item["content"])
+        name_terms = self._extract_terms(Path(item["file"]).stem)
+        return len(query_terms & file_terms) + 5 * len(query_terms & name_terms)
+
+    @staticmethod
+    def _truncate_to_tokens(content: str, tokens: int, budget: int) -> str:
+        """按比例截断内容到预算内，尽量在行尾截断"""
+        cut = int(len(content) * budget / max(tokens, 1))
+        newline = content.rfind("\n", 0, cut)
+        if newline > cut // 2:
+            cut = newline
+        return content[:cut] + "\n... (内容过长，已截断)"
 
     def _format_context(self, context_config: ContextConfig) -> str:
         """格式化上下文数据"""
@@ -294,13 +789,246 @@ class ContextManager:
         return extension_map.get(extension, 'text')
 
 
+class StepStream:
+    """步骤输出流
+
+    流式执行时累积已生成的内容，只需要上游输出前缀的下游步骤可以等待满足条件后提前读取。
+    """
+
+    def __init__(self):
+        self._chunks: List[str] = []
+        self._length = 0
+        # 内容被清空或替换时递增，等待者据此从头重新读取
+        self._version = 0
+        self.done = False
+        self._condition = asyncio.Condition()
+
+    def __len__(self) -> int:
+        return self._length
+
+    def text(self) -> str:
+        """当前已生成的全部内容"""
+        return "".join(self._chunks)
+
+    async def append(self, chunk: str):
+        """追加内容并唤醒等待者"""
+        async with self._condition:
+            self._chunks.append(chunk)
+            self._length += len(chunk)
+            self._condition.notify_all()
+
+    async def reset(self):
+        """清空已累积的内容（重试前调用）"""
+        async with self._condition:
+            self._chunks = []
+            self._length = 0
+            self._version += 1
+
+    async def finish(self, output: Optional[str] = None):
+        """标记结束；传入 output 时以其替换已累积的内容（如清理后的最终输出）"""
+        async with self._condition:
+            if output is not None:
+                self._chunks = [output]
+                self._length = len(output)
+                self._version += 1
+            self.done = True
+            self._condition.notify_all()
+
+    async def wait_for_prefix(self, min_chars: int) -> str:
+        """等待至少生成 min_chars 个字符（或已结束），返回前 min_chars 个字符
+
+        前缀在最后一个换行处截断，与唤醒时机无关，下游提示词（以及缓存键）保持稳定。
+        """
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.done or self._length >= min_chars)
+            text = self.text()
+            finished = self.done
+        # 未结束时即使恰好生成 min_chars 个字符，最后一行也可能不完整
+        if finished and len(text) <= min_chars:
+            return text
+        prefix = text[:min_chars]
+        line_end = prefix.rfind("\n")
+        return prefix[:line_end + 1] if line_end > 0 else prefix
+
+    async def wait_for(self, selector: _PartialOutputSelector) -> Optional[str]:
+        """把新到达的内容交给 selector，直到其返回结果或输出结束"""
+        result = None
+        cursor = 0
+        version = self._version
+
+        def ready() -> bool:
+            nonlocal result, cursor, version
+            if version != self._version:
+                selector.reset()
+                cursor, version = 0, self._version
+            if cursor < len(self._chunks):
+                result = selector.feed("".join(self._chunks[cursor:]))
+                cursor = len(self._chunks)
+            if result is None and self.done:
+                result = selector.finish()
+            return result is not None or self.done
+
+        async with self._condition:
+            await self._condition.wait_for(ready)
+        return result
+
+
+class StepCache:
+    """步骤结果缓存
+
+    以渲染后的提示词和LLM配置的哈希作为键，将清理后的输出保存在磁盘上。
+    上游步骤输出变化时，下游提示词随之变化，因此只有受影响的步骤会重新调用LLM。
+    """
+
+    def __init__(self, cache_dir: str, max_size_mb: int = 200):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size_mb * 1024 * 1024
+
+    @staticmethod
+    def make_key(prompt: str, llm_config: LLMConfig) -> str:
+        """根据提示词和LLM配置计算缓存键（api_key 不参与计算）"""
+        config_data = asdict(llm_config)
+        config_data.pop("api_key", None)
+        payload = json.dumps({"prompt": prompt, "llm": config_data}, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.txt"
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存，未命中返回 None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                content = f.read()
+        except FileNotFoundError:
+            return None
+        # 更新访问时间，淘汰时优先删除最久未使用的条目
+        os.utime(path, None)
+        return content
+
+    def set(self, key: str, output: str):
+        """写入缓存并按总大小淘汰旧条目"""
+        path = self._path(key)
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(output)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        """缓存总大小超过上限时，按最近使用时间从旧到新删除"""
+        entries = []
+        total_size = 0
+        for path in self.cache_dir.glob("*.txt"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # 批量执行时其他工作流可能已将其淘汰
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total_size += stat.st_size
+
+        if total_size <= self.max_size:
+            return
+
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            total_size -= size
+            if total_size <= self.max_size:
+                break
+
+
+class CheckpointStore:
+    """工作流断点存储
+
+    每个步骤完成后将 StepResult 写入 {checkpoint_dir}/{run_id}/{step_name}.json，
+    恢复执行时只加载成功的步骤，失败和未执行的步骤重新执行。
+    为控制文件大小，input_data 不保存。
+    """
+
+    def __init__(self, checkpoint_dir: str, run_id: str, resume: bool = False):
+        """
+        Args:
+            checkpoint_dir: 断点根目录
+            run_id: 运行ID
+            resume: 是否恢复已有运行，为 True 时运行ID必须已存在
+
+        Raises:
+            ValueError: 恢复执行时找不到该运行ID的 run.json（运行ID错误或不属于该断点目录）
+        """
+        self.run_id = run_id
+        self.run_dir = Path(checkpoint_dir) / run_id
+        if resume and not (self.run_dir / "run.json").exists():
+            raise ValueError(f"找不到运行ID {run_id} 的断点: {self.run_dir / 'run.json'} 不存在")
+        self.run_dir.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def new_run_id() -> str:
+        return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{os.urandom(3).hex()}"
+
+    def save_meta(self, workflow_config: WorkflowConfig):
+        """保存运行信息，恢复时沿用原来的需求"""
+        meta = {"workflow": workflow_config.name, "requirement": workflow_config.requirement}
+        self._write_json(self.run_dir / "run.json", meta)
+
+    def load_meta(self) -> Dict[str, Any]:
+        with open(self.run_dir / "run.json", 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    async def save(self, result: StepResult):
+        """在线程中写入步骤结果，不阻塞事件循环"""
+        data = asdict(result)
+        data["input_data"] = {}
+        data["timestamp"] = result.timestamp.isoformat()
+        await asyncio.to_thread(self._write_json, self.run_dir / f"{result.step_name}.json", data)
+
+    def load_completed(self) -> Dict[str, StepResult]:
+        """加载已成功完成的步骤结果"""
+        results = {}
+        for path in self.run_dir.glob("*.json"):
+            if path.name == "run.json":
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not data.get("success"):
+                continue
+            data["timestamp"] = datetime.fromisoformat(data["timestamp"])
+            data["metrics"] = StepMetrics(**data.get("metrics", {}))
+            result = StepResult(**data)
+            results[result.step_name] = result
+        return results
+
+    @staticmethod
+    def _write_json(path: Path, data: Dict[str, Any]):
+        """先写临时文件再替换，避免中途崩溃留下不完整的断点"""
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
 class Logger:
-    """日志管理器"""
+    """日志管理器
 
-    def __init__(self, log_dir: str):
+    日志以 JSON Lines 格式写入。记录日志只是放入内存缓冲区，由事件循环中的后台任务
+    按间隔批量写入（文件IO在线程中执行，不阻塞事件循环），关闭或进程退出时写入剩余内容。
+    """
+
+    def __init__(self, log_dir: str, flush_interval: float = 1.0, max_buffer_size: int = 10000):
         self.log_dir = Path(log_dir)
-        self.log_dir.mkdir(exist_ok=True)
+        self.log_dir.mkdir(parents=True, exist_ok=True)
         self.log_file = self.log_dir / f"workflow_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+        self.flush_interval = flush_interval
+        self.max_buffer_size = max_buffer_size
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+        # 保证批量写入按顺序进行
+        self._write_lock = threading.Lock()
+        self._flush_lock = asyncio.Lock()
+        atexit.register(self.flush)
 
     def log_step_result(self, result: StepResult):
         """记录步骤结果"""
@@ -311,11 +1039,15 @@ class Logger:
             "success": result.success,
             "input_size": len(str(result.input_data)),
             "output_size": len(result.output_data),
+            "context_tokens_raw": result.context_tokens_raw,
+            "context_tokens_packed": result.context_tokens_packed,
+            "first_token_latency": result.first_token_latency,
+            "llm_name": result.llm_name,
+            "metrics": asdict(result.metrics),
             "error_message": result.error_message
         }
 
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        self._append(log_entry)
 
     def log_message(self, message: str, level: str = "INFO"):
         """记录普通消息"""
@@ -325,84 +1057,444 @@ class Logger:
             "message": message
         }
 
-        with open(self.log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + "\n")
+        self._append(log_entry)
+
+    def _append(self, log_entry: Dict[str, Any]):
+        """放入缓冲区，并确保后台写入任务在运行"""
+        self._buffer.append(log_entry)
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中：缓冲区满时同步写入
+            if len(self._buffer) >= self.max_buffer_size:
+                self.flush()
+            return
+
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """按间隔批量写入缓冲区内容"""
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            # 取消时让正在进行的写入完成
+            await asyncio.shield(self.aflush())
+
+    def _take_buffer(self) -> List[Dict[str, Any]]:
+        entries, self._buffer = self._buffer, []
+        return entries
+
+    def _write_entries(self, entries: List[Dict[str, Any]]):
+        """序列化并一次性写入一批日志"""
+        if not entries:
+            return
+        data = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in entries)
+        with self._write_lock:
+            with open(self.log_file, 'a', encoding='utf-8') as f:
+                f.write(data)
+
+    async def aflush(self):
+        """在线程中写入缓冲区内容，不阻塞事件循环"""
+        async with self._flush_lock:
+            entries = self._take_buffer()
+            if entries:
+                await asyncio.to_thread(self._write_entries, entries)
+
+    def flush(self):
+        """同步写入缓冲区内容"""
+        self._write_entries(self._take_buffer())
+
+    async def aclose(self):
+        """停止后台写入任务并写入剩余内容"""
+        if self._flush_task is not None and not self._flush_task.done():
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+        self._flush_task = None
+        await self.aflush()
+        # 已正常关闭，不再需要退出钩子（否则每个实例都会一直被 atexit 持有）
+        atexit.unregister(self.flush)
+
+
+class TraceExporter:
+    """导出步骤指标：JSON 指标文件和 OpenTelemetry (OTLP/JSON) 格式的 span 文件"""
+
+    @staticmethod
+    def export(workflow_name: str, results: Dict[str, StepResult], start_time: float,
+               end_time: float, output_dir: Path, file_stem: str) -> Tuple[Path, Path]:
+        """写入指标文件和 span 文件，返回两者路径"""
+        metrics_file = Path(output_dir) / f"{file_stem}_metrics.json"
+        trace_file = Path(output_dir) / f"{file_stem}_trace.json"
+
+        with open(metrics_file, 'w', encoding='utf-8') as f:
+            json.dump(TraceExporter.to_metrics(workflow_name, results, start_time, end_time),
+                      f, ensure_ascii=False, indent=2)
+
+        with open(trace_file, 'w', encoding='utf-8') as f:
+            json.dump(TraceExporter.to_otlp(workflow_name, results, start_time, end_time),
+                      f, ensure_ascii=False)
+
+        return metrics_file, trace_file
+
+    @staticmethod
+    def to_metrics(workflow_name: str, results: Dict[str, StepResult],
+                   start_time: float, end_time: float) -> Dict[str, Any]:
+        """汇总每个步骤的指标，按耗时从高到低排列"""
+        steps = []
+        for result in results.values():
+            step = {
+                "step_name": result.step_name,
+                "success": result.success,
+                "cached": result.cached,
+                "duration": result.duration,
+                "time_to_first_token": result.first_token_latency,
+            }
+            step.update(asdict(result.metrics))
+            steps.append(step)
+        steps.sort(key=lambda step: step["end_time"] - step["start_time"], reverse=True)
+
+        return {
+            "workflow": workflow_name,
+            "wall_time": end_time - start_time,
+            "steps": steps
+        }
+
+    @staticmethod
+    def to_otlp(workflow_name: str, results: Dict[str, StepResult],
+                start_time: float, end_time: float) -> Dict[str, Any]:
+        """生成 OTLP/JSON 格式的 trace：工作流为根 span，每个步骤为子 span"""
+        trace_id = os.urandom(16).hex()
+        root_span_id = os.urandom(8).hex()
+
+        spans = [{
+            "traceId": trace_id,
+            "spanId": root_span_id,
+            "name": workflow_name,
+            "kind": 1,
+            "startTimeUnixNano": str(int(start_time * 1e9)),
+            "endTimeUnixNano": str(int(end_time * 1e9)),
+            "attributes": [],
+            "status": {"code": 1}
+        }]
+
+        for result in results.values():
+            metrics = result.metrics
+            attributes = {
+                "workflow.step.cached": result.cached,
+                "workflow.step.queue_wait_s": metrics.queue_wait,
+                "workflow.step.prompt_build_s": metrics.prompt_build_time,
+                "workflow.step.llm_latency_s": metrics.llm_latency,
+                "workflow.step.time_to_first_token_s": result.first_token_latency,
+                "workflow.step.retries": metrics.retries,
+                "workflow.step.llm_name": result.llm_name,
+                "gen_ai.usage.input_tokens": metrics.input_tokens,
+                "gen_ai.usage.output_tokens": metrics.output_tokens,
+            }
+            status = {"code": 1} if result.success else {"code": 2, "message": result.error_message or ""}
+            spans.append({
+                "traceId": trace_id,
+                "spanId": os.urandom(8).hex(),
+                "parentSpanId": root_span_id,
+                "name": result.step_name,
+                "kind": 1,
+                "startTimeUnixNano": str(int(metrics.start_time * 1e9)),
+                "endTimeUnixNano": str(int(metrics.end_time * 1e9)),
+                "attributes": [TraceExporter._attribute(key, value)
+                               for key, value in attributes.items() if value is not None],
+                "status": status
+            })
+
+        return {
+            "resourceSpans": [{
+                "resource": {"attributes": [TraceExporter._attribute("service.name", "code-generation-workflow")]},
+                "scopeSpans": [{
+                    "scope": {"name": "workflow"},
+                    "spans": spans
+                }]
+            }]
+        }
+
+    @staticmethod
+    def _attribute(key: str, value: Any) -> Dict[str, Any]:
+        """转换为 OTLP 属性格式"""
+        if isinstance(value, bool):
+            return {"key": key, "value": {"boolValue": value}}
+        if isinstance(value, int):
+            return {"key": key, "value": {"intValue": str(value)}}
+        if isinstance(value, float):
+            return {"key": key, "value": {"doubleValue": value}}
+        return {"key": key, "value": {"stringValue": str(value)}}
 
 
 class WorkflowExecutor:
     """工作流执行器"""
 
-    def __init__(self, workflow_config: WorkflowConfig, llm_configs: Dict[str, LLMConfig]):
+    def __init__(self, workflow_config: WorkflowConfig, llm_configs: Dict[str, LLMConfig],
+                 context_manager: Optional[ContextManager] = None,
+                 provider_semaphores: Optional[Dict[str, asyncio.Semaphore]] = None,
+                 global_semaphore: Optional[asyncio.Semaphore] = None,
+                 circuit_breakers: Optional[Dict[str, CircuitBreaker]] = None,
+                 run_id: Optional[str] = None, resume: bool = False):
+        """
+        Args:
+            workflow_config: 工作流配置
+            llm_configs: LLM配置
+            context_manager: 共享的上下文管理器，批量执行时多个工作流共用
+            provider_semaphores: 共享的提供商并发信号量，批量执行时多个工作流共用
+            global_semaphore: 全局LLM调用并发信号量
+            circuit_breakers: 共享的提供商熔断器，批量执行时多个工作流共用
+            run_id: 运行ID，为空时自动生成
+            resume: 是否从 run_id 对应的断点恢复执行
+        """
         self.workflow_config = workflow_config
         self.llm_configs = llm_configs
-        self.context_manager = ContextManager(workflow_config.contexts)
+        if resume and not run_id:
+            raise ValueError("恢复执行需要指定 run_id")
+        self.resumed = resume
+        self.run_id = run_id or CheckpointStore.new_run_id()
+        self.checkpoints = CheckpointStore(workflow_config.checkpoint_dir, self.run_id, resume)
+        self.context_manager = context_manager or ContextManager(workflow_config.contexts)
         self.logger = Logger(workflow_config.log_dir)
         self.results: Dict[str, StepResult] = {}
+        self._provider_semaphores: Dict[str, asyncio.Semaphore] = \
+            provider_semaphores if provider_semaphores is not None else {}
+        self._global_semaphore = global_semaphore
+        self._circuit_breakers: Dict[str, CircuitBreaker] = \
+            circuit_breakers if circuit_breakers is not None else {}
+        # 步骤名 -> (上下文原始token数, 打包后token数)
+        self._context_stats: Dict[str, Tuple[int, int]] = {}
+        # 步骤名 -> 输出流，execute 开始时创建
+        self._streams: Dict[str, StepStream] = {}
+        # 指标文件与 trace 文件，execute 结束时写入
+        self.metrics_file: Optional[Path] = None
+        self.trace_file: Optional[Path] = None
+        self.cache = StepCache(workflow_config.cache_dir, workflow_config.cache_max_size_mb) \
+            if workflow_config.use_cache else None
 
         # 创建输出目录
-        Path(workflow_config.output_dir).mkdir(exist_ok=True)
+        Path(workflow_config.output_dir).mkdir(parents=True, exist_ok=True)
 
     async def execute(self) -> Dict[str, StepResult]:
-        """执行工作流"""
-        self.logger.log_message(f"开始执行工作流: {self.workflow_config.name}")
-
-        for step_config in self.workflow_config.steps:
-            try:
-                result = await self._execute_step(step_config)
-                self.results[step_config.name] = result
-                self.logger.log_step_result(result)
+        """执行工作流
+
+        按 depends_on 构成的依赖图调度：依赖全部完成的步骤立即并发执行，
+        同一LLM提供商的并发数受 provider_concurrency 限制。
+        """
+        self.logger.log_message(f"开始执行工作流: {self.workflow_config.name} (run_id: {self.run_id})")
+        workflow_start = time.time()
+
+        self._validate_dependencies()
+        self._streams = {step.name: StepStream() for step in self.workflow_config.steps}
+
+        pending = {step.name: step for step in self.workflow_config.steps}
+        running: Dict[asyncio.Task, str] = {}
+
+        if self.resumed:
+            # 恢复执行：沿用原来的需求，跳过已成功的步骤
+            meta = self.checkpoints.load_meta()
+            if meta.get("requirement"):
+                self.workflow_config.requirement = meta["requirement"]
+            for step_name, result in self.checkpoints.load_completed().items():
+                if step_name in pending:
+                    self.results[step_name] = result
+                    del pending[step_name]
+                    await self._streams[step_name].finish(result.output_data)
+            self.logger.log_message(f"从断点恢复，已完成步骤: {', '.join(self.results) or '无'}")
+        else:
+            self.checkpoints.save_meta(self.workflow_config)
 
-                # 保存步骤输出
-                self._save_step_output(step_config.name, result.output_data)
+        while pending or running:
+            # 启动所有依赖已完成的步骤
+            for step_name, step_config in list(pending.items()):
+                if all(dep in self.results for dep in (step_config.depends_on or [])):
+                    del pending[step_name]
+                    task = asyncio.create_task(self._run_step(step_config))
+                    running[task] = step_name
 
-            except Exception as e:
-                error_result = StepResult(
-                    step_name=step_config.name,
-                    input_data={},
-                    output_data="",
-                    duration=0.0,
-                    timestamp=datetime.now(),
-                    success=False,
-                    error_message=str(e)
-                )
-                self.results[step_config.name] = error_result
-                self.logger.log_step_result(error_result)
-                self.logger.log_message(f"步骤 {step_config.name} 执行失败: {e}", "ERROR")
+            done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del running[task]
 
         self.logger.log_message("工作流执行完成")
+        self.metrics_file, self.trace_file = TraceExporter.export(
+            self.workflow_config.name, self.results, workflow_start, time.time(),
+            self.logger.log_dir, self.logger.log_file.stem
+        )
+        await self.logger.aclose()
         return self.results
 
-    async def _execute_step(self, step_config: StepConfig) -> StepResult:
+    def _validate_dependencies(self):
+        """校验步骤依赖：依赖必须存在且不能成环"""
+        steps = {step.name: step for step in self.workflow_config.steps}
+
+        def all_deps(step: StepConfig) -> List[str]:
+            return list(step.depends_on or []) + list(step.prefix_depends_on or {})
+
+        for step in steps.values():
+            for dep in all_deps(step):
+                if dep not in steps:
+                    raise ValueError(f"步骤 {step.name} 依赖了不存在的步骤: {dep}")
+
+        visited = set()
+        visiting = set()
+
+        def visit(name: str):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"步骤依赖存在循环: {name}")
+            visiting.add(name)
+            for dep in all_deps(steps[name]):
+                visit(dep)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in steps:
+            visit(name)
+
+    def _get_circuit_breaker(self, provider: str) -> CircuitBreaker:
+        """获取LLM提供商对应的熔断器"""
+        if provider not in self._circuit_breakers:
+            self._circuit_breakers[provider] = CircuitBreaker(
+                self.workflow_config.circuit_failure_threshold,
+                self.workflow_config.circuit_reset_timeout
+            )
+        return self._circuit_breakers[provider]
+
+    def _get_provider_semaphore(self, provider: str) -> asyncio.Semaphore:
+        """获取LLM提供商对应的并发信号量"""
+        if provider not in self._provider_semaphores:
+            limit = self.workflow_config.provider_concurrency.get(
+                provider, self.workflow_config.default_concurrency
+            )
+            self._provider_semaphores[provider] = asyncio.Semaphore(max(1, limit))
+        return self._provider_semaphores[provider]
+
+    async def _run_step(self, step_config: StepConfig):
+        """在提供商并发限制下执行步骤并记录结果"""
+        stream = self._streams[step_config.name]
+        metrics = StepMetrics(start_time=time.time())
+        try:
+            # 前缀依赖在占用并发名额之前等待
+            prefix_inputs = await self._wait_prefix_dependencies(step_config)
+
+            # 依赖步骤失败时不再以缺失的输入继续执行
+            dependencies = list(step_config.depends_on or []) + list(step_config.prefix_depends_on or {})
+            failed_deps = [dep for dep in dependencies if dep in self.results and not self.results[dep].success]
+            if failed_deps:
+                raise RuntimeError(f"依赖步骤失败: {', '.join(failed_deps)}")
+
+            result = await self._execute_step(step_config, prefix_inputs, metrics)
+            metrics.end_time = time.time()
+            result.metrics = metrics
+            self.results[step_config.name] = result
+            await stream.finish(result.output_data)
+            self.logger.log_step_result(result)
+
+            # 保存步骤输出
+            self._save_step_output(step_config.name, result.output_data)
+
+        except Exception as e:
+            error_result = StepResult(
+                step_name=step_config.name,
+                input_data={},
+                output_data="",
+                duration=0.0,
+                timestamp=datetime.now(),
+                success=False,
+                error_message=str(e),
+                metrics=metrics
+            )
+            metrics.end_time = time.time()
+            self.results[step_config.name] = error_result
+            self.logger.log_step_result(error_result)
+            self.logger.log_message(f"步骤 {step_config.name} 执行失败: {e}", "ERROR")
+            await stream.finish()
+
+        # 断点写入失败（磁盘满、无权限等）不影响步骤本身的结果，只是无法从该步骤恢复
+        try:
+            await self.checkpoints.save(self.results[step_config.name])
+        except Exception as e:
+            self.logger.log_message(f"步骤 {step_config.name} 断点保存失败: {e}", "WARNING")
+
+    async def _wait_prefix_dependencies(self, step_config: StepConfig) -> Dict[str, str]:
+        """等待部分依赖的上游输出满足条件，返回清理后的所需部分"""
+        prefix_inputs = {}
+        for dep_step, spec in (step_config.prefix_depends_on or {}).items():
+            stream = self._streams[dep_step]
+            if isinstance(spec, int):
+                prefix_inputs[dep_step] = await stream.wait_for_prefix(spec)
+            else:
+                selected = await stream.wait_for(_PartialOutputSelector(spec))
+                prefix_inputs[dep_step] = selected or ""
+            if not stream.done:
+                self.logger.log_message(f"步骤 {step_config.name} 在 {dep_step} 完成前提前开始")
+        return prefix_inputs
+
+    async def _execute_step(self, step_config: StepConfig,
+                            prefix_inputs: Optional[Dict[str, str]] = None,
+                            metrics: Optional[StepMetrics] = None) -> StepResult:
         """执行单个步骤"""
         print('-'*30)
         print(f"执行工作流步骤: {step_config.name}")
 
         start_time = time.time()
+        if metrics is None:
+            metrics = StepMetrics(start_time=start_time)
 
         # 准备输入数据
         input_data = self._prepare_step_input(step_config)
-        print(f"---input_data: {input_data}")
+        if prefix_inputs:
+            input_data.update(prefix_inputs)
+        self._debug_print(f"---input_data: {input_data}")
+        context_tokens_raw, context_tokens_packed = self._context_stats.get(step_config.name, (0, 0))
 
 
-        # 获取LLM配置并创建实例
+        # 获取LLM配置
         llm_config = self.llm_configs[step_config.llm_name]
-        print(f"---create llm: {step_config.llm_name}")
-
-        llm = LLMFactory.create_llm(llm_config)
 
         # 构建提示
+        build_start = time.time()
         prompt = self._build_prompt(step_config, input_data)
-        print(f"---prompt: {prompt}")
+        metrics.prompt_build_time = time.time() - build_start
+        self._debug_print(f"---prompt: {prompt}")
+
+        # 命中缓存时直接复用上次输出
+        if self.cache:
+            cache_key = StepCache.make_key(prompt, llm_config)
+            cached_output = self.cache.get(cache_key)
+            if cached_output is not None:
+                print(f"---cache hit: {step_config.name}")
+                print('='*30)
+                return StepResult(
+                    step_name=step_config.name,
+                    input_data=input_data,
+                    output_data=cached_output,
+                    duration=time.time() - start_time,
+                    timestamp=datetime.now(),
+                    success=True,
+                    cached=True,
+                    context_tokens_raw=context_tokens_raw,
+                    context_tokens_packed=context_tokens_packed,
+                    metrics=metrics
+                )
 
-        # 执行LLM调用
+        # 执行LLM调用（含重试与故障转移）
         messages = [HumanMessage(content=prompt)]
-        response = await llm.ainvoke(messages)
-
-        # 清理输出内容
-        cleaned_output = LLMFactory.clean_output(response.content)
+        llm_start = time.time()
+        cleaned_output, first_token_latency, usage, used_config = \
+            await self._invoke_with_failover(step_config, messages, metrics)
+        metrics.llm_latency = time.time() - llm_start
+        metrics.input_tokens, metrics.output_tokens = usage
 
-        print(f"---response.content: {cleaned_output}")
+        self._debug_print(f"---response.content: {cleaned_output}")
 
+        # 按实际使用的LLM配置写入缓存，故障转移的结果不会冒充主LLM的输出
+        if self.cache:
+            self.cache.set(StepCache.make_key(prompt, used_config), cleaned_output)
 
         duration = time.time() - start_time
         print('='*30)
@@ -413,9 +1505,135 @@ class WorkflowExecutor:
             output_data=cleaned_output,
             duration=duration,
             timestamp=datetime.now(),
-            success=True
+            success=True,
+            context_tokens_raw=context_tokens_raw,
+            context_tokens_packed=context_tokens_packed,
+            first_token_latency=first_token_latency,
+            llm_name=used_config.name,
+            metrics=metrics
         )
 
+    async def _invoke_with_failover(self, step_config: StepConfig, messages,
+                                    metrics: StepMetrics) -> Tuple[str, Optional[float], tuple, LLMConfig]:
+        """依次尝试主LLM和备用LLM，每个LLM对可重试错误按指数退避重试
+
+        Returns:
+            (清理后的输出, 首个token延迟, (输入token数, 输出token数), 实际使用的LLM配置)
+        """
+        llm_names = [step_config.llm_name] + list(step_config.fallback_llm_names or [])
+        max_retries = step_config.max_retries if step_config.max_retries is not None \
+            else self.workflow_config.max_retries
+        last_error: Optional[Exception] = None
+
+        for llm_name in llm_names:
+            llm_config = self.llm_configs[llm_name]
+            breaker = self._get_circuit_breaker(llm_config.provider)
+
+            for attempt in range(max_retries + 1):
+                if not breaker.allow():
+                    last_error = RuntimeError(f"LLM提供商 {llm_config.provider} 已熔断")
+                    self.logger.log_message(
+                        f"步骤 {step_config.name} 跳过已熔断的LLM: {llm_name}", "WARNING")
+                    break
+
+                if attempt > 0 or llm_name != step_config.llm_name:
+                    metrics.retries += 1
+
+                try:
+                    output = await self._call_llm(step_config.name, llm_config, messages, metrics)
+                    breaker.record_success()
+                    return output + (llm_config,)
+                except asyncio.CancelledError:
+                    # 被取消的试探调用若不释放名额，熔断器会一直停在半开状态
+                    breaker.release()
+                    raise
+                except Exception as e:
+                    last_error = e
+                    retryable = _is_retryable(e)
+                    # 只有超时、连接错误、限流和5xx说明提供商不可用，请求本身的错误不计入熔断
+                    if retryable:
+                        breaker.record_failure()
+                    else:
+                        breaker.release()
+                    self.logger.log_message(
+                        f"步骤 {step_config.name} 调用 {llm_name} 失败"
+                        f"(第 {attempt + 1} 次, {'可重试' if retryable else '不可重试'}): {e}", "WARNING")
+                    if not retryable or attempt == max_retries:
+                        break
+                    # 带完全抖动的指数退避
+                    delay = min(self.workflow_config.retry_max_delay,
+                                self.workflow_config.retry_base_delay * (2 ** attempt))
+                    await asyncio.sleep(random.uniform(0, delay))
+
+            if llm_name != llm_names[-1]:
+                self.logger.log_message(f"步骤 {step_config.name} 故障转移: {llm_name} -> 下一个备用LLM", "WARNING")
+
+        raise last_error
+
+    async def _call_llm(self, step_name: str, llm_config: LLMConfig, messages,
+                        metrics: StepMetrics) -> Tuple[str, Optional[float], tuple]:
+        """在提供商并发限制下调用一次LLM，返回清理后的输出"""
+        queued_at = time.time()
+        async with self._get_provider_semaphore(llm_config.provider), \
+                (self._global_semaphore or contextlib.nullcontext()):
+            metrics.queue_wait += time.time() - queued_at
+
+            # 获取LLM实例（同名配置在步骤间复用连接池）
+            print(f"---get llm: {llm_config.name}")
+            llm = LLMFactory.get_llm(llm_config)
+
+            if self.workflow_config.stream:
+                output, first_token_latency, usage = await self._stream_llm(step_name, llm, messages)
+                print(f"---first token: {first_token_latency:.2f}s" if first_token_latency is not None
+                      else "---first token: (empty)")
+                return output, first_token_latency, usage
+
+            response = await llm.ainvoke(messages)
+            return LLMFactory.clean_output(response.content), None, _extract_usage(response)
+
+    async def _stream_llm(self, step_name: str, llm,
+                          messages) -> Tuple[str, Optional[float], Tuple[Optional[int], Optional[int]]]:
+        """流式调用LLM，边生成边清理并写入输出文件
+
+        Returns:
+            (清理后的输出, 首个token延迟秒数, (输入token数, 输出token数))
+        """
+        stream = self._streams[step_name]
+        # 重试时丢弃上一次未完成的输出
+        await stream.reset()
+        output_file = Path(self.workflow_config.output_dir) / f"{step_name}.txt"
+        start_time = time.time()
+        first_token_latency = None
+        input_tokens = output_tokens = None
+        cleaner = StreamingOutputCleaner()
+
+        with open(output_file, 'w', encoding='utf-8') as f:
+            async for chunk in llm.astream(messages):
+                # 用量通常只出现在最后一个块中，出现多次时累加
+                chunk_input, chunk_output = _extract_usage(chunk)
+                if chunk_input is not None:
+                    input_tokens = (input_tokens or 0) + chunk_input
+                if chunk_output is not None:
+                    output_tokens = (output_tokens or 0) + chunk_output
+
+                content = chunk.content if hasattr(chunk, 'content') else str(chunk)
+                if not content:
+                    continue
+                if first_token_latency is None:
+                    first_token_latency = time.time() - start_time
+                cleaned = cleaner.feed(content)
+                if cleaned:
+                    f.write(cleaned)
+                    f.flush()
+                    await stream.append(cleaned)
+
+            remaining = cleaner.finish()
+            if remaining:
+                f.write(remaining)
+                await stream.append(remaining)
+
+        return stream.text(), first_token_latency, (input_tokens, output_tokens)
+
     def _prepare_step_input(self, step_config: StepConfig) -> Dict[str, Any]:
         """准备步骤输入数据"""
         input_data = {}
@@ -432,22 +1650,145 @@ class WorkflowExecutor:
                 if dep_step in self.results:
                     input_data[dep_step] = self.results[dep_step].output_data
 
-        # 添加上下文信息
+        # 添加上下文信息（按步骤的token预算打包）
         if step_config.context_type:
-            input_data["context"] = self.context_manager.get_context(step_config.context_type)
+            query = "\n".join(str(value) for value in input_data.values())
+            if hasattr(self.workflow_config, 'requirement') and self.workflow_config.requirement:
+                query = self.workflow_config.requirement + "\n" + query
+            context, raw_tokens, packed_tokens = self.context_manager.pack_context(
+                step_config.context_type, step_config.context_token_budget, query
+            )
+            input_data["context"] = context
+            self._context_stats[step_config.name] = (raw_tokens, packed_tokens)
+            self.logger.log_message(
+                f"步骤 {step_config.name} 上下文token: 原始 {raw_tokens}, 打包后 {packed_tokens}"
+            )
 
         return input_data
 
     def _build_prompt(self, step_config: StepConfig, input_data: Dict[str, Any]) -> str:
         """构建提示词"""
-        prompt_template = ChatPromptTemplate.from_template(step_config.prompt_template)
+        prompt_template = step_config.compiled_prompt
+        if prompt_template is None:
+            prompt_template = ChatPromptTemplate.from_template(step_config.prompt_template)
+            step_config.compiled_prompt = prompt_template
         return prompt_template.format(**input_data)
 
+    def _debug_print(self, message: str):
+        """打印大段调试信息，安静模式下不输出"""
+        if not self.workflow_config.quiet:
+            print(message)
+
     def _save_step_output(self, step_name: str, output: str):
-        """保存步骤输出"""
-        output_file = Path(self.workflow_config.output_dir) / f"{step_name}.txt"
-        with open(output_file, 'w', encoding='utf-8') as f:
-            f.write(output)
+        """保存步骤输出
+
+        完整输出写入 {step_name}.txt；其中带文件名的代码块另外拆分到 {step_name}/ 目录下，
+        内容未变化的文件不重写。
+        """
+        output_dir = self.workflow_config.output_dir
+        files = {os.path.join(output_dir, f"{step_name}.txt"): output}
+
+        step_dir = os.path.join(output_dir, step_name)
+        for file_path, content in split_code_blocks(output):
+            try:
+                files[safe_join(step_dir, file_path)] = content
+            except ValueError as e:
+                self.logger.log_message(f"步骤 {step_name} 跳过文件: {e}", "WARNING")
+
+        written, unchanged = write_files(files)
+        if len(files) > 1:
+            self._debug_print(f"📁 {step_name}: 拆分出 {len(files) - 1} 个文件，"
+                              f"写入 {len(written)} 个，未变化 {len(unchanged)} 个")
+
+
+class BatchRunner:
+    """批量执行器
+
+    为多个模块需求并发执行同一个工作流，共享上下文管理器、LLM客户端和并发限制，
+    每个模块的输出和日志写入各自的子目录。
+    """
+
+    def __init__(self, workflow_config: WorkflowConfig, llm_configs: Dict[str, LLMConfig],
+                 max_concurrency: int = 8, resume_run_id: Optional[str] = None):
+        """
+        Args:
+            workflow_config: 工作流配置（requirement 会被每个模块的需求替换）
+            llm_configs: LLM配置
+            max_concurrency: 全局同时进行的LLM调用数
+            resume_run_id: 要恢复的批量运行ID，为空时开始新的运行
+        """
+        self.workflow_config = workflow_config
+        self.llm_configs = llm_configs
+        self.context_manager = ContextManager(workflow_config.contexts)
+        self.provider_semaphores: Dict[str, asyncio.Semaphore] = {}
+        self.global_semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self.resumed = resume_run_id is not None
+        self.run_id = resume_run_id or CheckpointStore.new_run_id()
+        self.executors: Dict[str, WorkflowExecutor] = {}
+
+    @staticmethod
+    def load_requirements(path: str) -> List[Dict[str, str]]:
+        """读取批量需求文件，支持 CSV（表头包含 module,requirement）和 JSONL"""
+        modules = []
+        # Excel 另存的 UTF-8 CSV 带 BOM，不去掉时首列表头会变成 '\ufeffmodule'
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            if path.endswith('.csv'):
+                rows = list(csv.DictReader(f))
+            else:
+                rows = [json.loads(line) for line in f if line.strip()]
+
+        for index, row in enumerate(rows, start=1):
+            module = (row.get("module") or "").strip()
+            requirement = (row.get("requirement") or "").strip()
+            if not module or not requirement:
+                raise ValueError(f"批量需求文件第 {index} 条缺少 module 或 requirement: {row}")
+            modules.append({"module": module, "requirement": requirement})
+
+        names = [m["module"] for m in modules]
+        duplicates = sorted({name for name in names if names.count(name) > 1})
+        if duplicates:
+            raise ValueError(f"批量需求文件中模块名重复: {', '.join(duplicates)}")
+        return modules
+
+    def _module_config(self, module: str, requirement: str) -> WorkflowConfig:
+        """生成单个模块的工作流配置，输出和日志写入模块子目录"""
+        safe_name = re.sub(r'[\\/:*?"<>|]', '_', module)
+        return replace(
+            self.workflow_config,
+            requirement=requirement,
+            output_dir=str(Path(self.workflow_config.output_dir) / safe_name),
+            log_dir=str(Path(self.workflow_config.log_dir) / safe_name),
+            checkpoint_dir=str(Path(self.workflow_config.checkpoint_dir) / safe_name)
+        )
+
+    async def run(self, modules: List[Dict[str, str]]) -> Dict[str, Dict[str, StepResult]]:
+        """并发执行所有模块，返回 模块名 -> 步骤结果"""
+        for item in modules:
+            self.executors[item["module"]] = WorkflowExecutor(
+                self._module_config(item["module"], item["requirement"]),
+                self.llm_configs,
+                context_manager=self.context_manager,
+                provider_semaphores=self.provider_semaphores,
+                global_semaphore=self.global_semaphore,
+                circuit_breakers=self.circuit_breakers,
+                run_id=self.run_id,
+                resume=self.resumed
+            )
+
+        results = await asyncio.gather(
+            *(executor.execute() for executor in self.executors.values()),
+            return_exceptions=True
+        )
+
+        batch_results = {}
+        for module, result in zip(self.executors, results):
+            if isinstance(result, Exception):
+                print(f"模块 {module} 执行失败: {result}")
+                batch_results[module] = {}
+            else:
+                batch_results[module] = result
+        return batch_results
 
 
 class ConfigLoader:
@@ -458,6 +1799,12 @@ class ConfigLoader:
         """加载所有配置"""
         llm_configs = ConfigLoader._load_llm_configs(llm_config_path)
         workflow_config = ConfigLoader._load_workflow_config(workflow_config_path)
+
+        for step in workflow_config.steps:
+            for llm_name in [step.llm_name] + list(step.fallback_llm_names or []):
+                if llm_name not in llm_configs:
+                    raise ValueError(f"步骤 {step.name} 使用了未定义的LLM配置: {llm_name}")
+
         return llm_configs, workflow_config
 
     @staticmethod
@@ -491,15 +1838,25 @@ class ConfigLoader:
             contexts[context_name] = ContextConfig(**context_data)
 
         # 解析步骤配置
+        max_retries = data.get("max_retries", 2)
+        ConfigLoader._check_max_retries(max_retries, "工作流")
+
         steps = []
         for step_data in data.get("steps", []):
+            if step_data.get("max_retries") is not None:
+                ConfigLoader._check_max_retries(step_data["max_retries"], f"步骤 {step_data['name']}")
             step_config = StepConfig(
                 name=step_data["name"],
                 llm_name=step_data["llm_name"],
                 prompt_template=step_data["prompt_template"],
                 context_type=step_data.get("context_type"),
-                depends_on=step_data.get("depends_on", [])
+                depends_on=step_data.get("depends_on", []),
+                context_token_budget=step_data.get("context_token_budget"),
+                prefix_depends_on=step_data.get("prefix_depends_on", {}),
+                fallback_llm_names=step_data.get("fallback_llm_names", []),
+                max_retries=step_data.get("max_retries")
             )
+            step_config.compiled_prompt = ConfigLoader._compile_prompt(step_config, contexts)
             steps.append(step_config)
 
         return WorkflowConfig(
@@ -508,36 +1865,146 @@ class ConfigLoader:
             contexts=contexts,
             steps=steps,
             output_dir=data.get("output_dir", "./output"),
-            log_dir=data.get("log_dir", "./logs")
+            log_dir=data.get("log_dir", "./logs"),
+            provider_concurrency=data.get("provider_concurrency", {}),
+            default_concurrency=data.get("default_concurrency", 2),
+            cache_dir=data.get("cache_dir", "./.cache"),
+            cache_max_size_mb=data.get("cache_max_size_mb", 200),
+            stream=data.get("stream", False),
+            quiet=data.get("quiet", False),
+            checkpoint_dir=data.get("checkpoint_dir", "./checkpoints"),
+            max_retries=max_retries,
+            retry_base_delay=data.get("retry_base_delay", 1.0),
+            retry_max_delay=data.get("retry_max_delay", 30.0),
+            circuit_failure_threshold=data.get("circuit_failure_threshold", 5),
+            circuit_reset_timeout=data.get("circuit_reset_timeout", 60.0)
         )
 
+    @staticmethod
+    def _check_max_retries(max_retries: Any, owner: str):
+        """重试次数必须是非负整数，否则一次都不会调用LLM"""
+        if isinstance(max_retries, bool) or not isinstance(max_retries, int) or max_retries < 0:
+            raise ValueError(f"{owner} 的 max_retries 必须是非负整数: {max_retries}")
 
-async def main():
-    """主函数"""
-    # 加载配置
-    llm_configs, workflow_config = ConfigLoader.load_configs(
-        "llm_config.yaml",
-        "workflow_config.yaml"
-    )
+    @staticmethod
+    def _compile_prompt(step_config: StepConfig, contexts: Dict[str, ContextConfig]) -> ChatPromptTemplate:
+        """预编译步骤提示模板，并校验模板变量都能由依赖步骤或上下文提供"""
+        if step_config.context_type and step_config.context_type not in contexts:
+            raise ValueError(f"步骤 {step_config.name} 的上下文类型不存在: {step_config.context_type}")
+
+        for dep_step, spec in (step_config.prefix_depends_on or {}).items():
+            if isinstance(spec, int):
+                continue
+            if not isinstance(spec, dict) or len(spec) != 1 or not ({"section", "pattern"} & set(spec)):
+                raise ValueError(f"步骤 {step_config.name} 对 {dep_step} 的部分依赖格式错误: {spec}")
+            if "pattern" in spec:
+                try:
+                    re.compile(spec["pattern"])
+                except re.error as e:
+                    raise ValueError(f"步骤 {step_config.name} 对 {dep_step} 的正则无效: {e}")
+
+        prompt_template = ChatPromptTemplate.from_template(step_config.prompt_template)
+
+        available = set(step_config.depends_on or []) | set(step_config.prefix_depends_on or {})
+        if step_config.context_type:
+            available.add("context")
+        if step_config.name == "architecture_design":
+            available.add("requirement")
+
+        missing = set(prompt_template.input_variables) - available
+        if missing:
+            raise ValueError(
+                f"步骤 {step_config.name} 的提示模板变量无法提供: {', '.join(sorted(missing))}"
+                f"（请检查 depends_on / context_type）"
+            )
+        return prompt_template
 
-    # 创建执行器
-    executor = WorkflowExecutor(workflow_config, llm_configs)
 
-    # 执行工作流
-    results = await executor.execute()
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="代码生成工作流")
+    parser.add_argument("--llm-config", default="llm_config.yaml", help="LLM配置文件路径")
+    parser.add_argument("--workflow-config", default="workflow_config.yaml", help="工作流配置文件路径")
+    parser.add_argument("--no-cache", action="store_true", help="忽略步骤结果缓存，所有步骤重新调用LLM")
+    parser.add_argument("--stream", action="store_true", help="流式执行，边生成边写入输出文件")
+    parser.add_argument("--quiet", action="store_true", help="不打印提示词和模型输出等大段调试信息")
+    parser.add_argument("--batch", help="批量需求文件（CSV 或 JSONL，字段 module、requirement）")
+    parser.add_argument("--batch-concurrency", type=int, default=8, help="批量执行时全局同时进行的LLM调用数")
+    parser.add_argument("--resume", metavar="RUN_ID", help="从指定运行ID的断点恢复，只执行未完成或失败的步骤")
+    return parser.parse_args()
 
-    # 打印结果摘要
+
+def print_summary(workflow_config: WorkflowConfig, executor: WorkflowExecutor, results: Dict[str, StepResult]):
+    """打印单个工作流的结果摘要"""
     print(f"\n工作流 '{workflow_config.name}' 执行完成")
     print("=" * 50)
 
     for step_name, result in results.items():
         status = "✅ 成功" if result.success else "❌ 失败"
-        print(f"{step_name}: {status} (耗时: {result.duration:.2f}s)")
+        cache_note = " [缓存]" if result.cached else ""
+        ttft_note = f", 首token: {result.first_token_latency:.2f}s" if result.first_token_latency is not None else ""
+        print(f"{step_name}: {status}{cache_note} (耗时: {result.duration:.2f}s{ttft_note})")
         if not result.success:
             print(f"  错误: {result.error_message}")
 
     print(f"\n详细日志: {executor.logger.log_file}")
-    print(f"输出目录: {workflow_config.output_dir}")
+    print(f"步骤指标: {executor.metrics_file}")
+    print(f"Trace文件: {executor.trace_file}")
+    print(f"输出目录: {executor.workflow_config.output_dir}")
+
+
+async def run_batch(batch_file: str, workflow_config: WorkflowConfig,
+                    llm_configs: Dict[str, LLMConfig], max_concurrency: int,
+                    resume_run_id: Optional[str] = None):
+    """批量执行多个模块"""
+    modules = BatchRunner.load_requirements(batch_file)
+    runner = BatchRunner(workflow_config, llm_configs, max_concurrency, resume_run_id)
+    print(f"批量运行ID: {runner.run_id}（中断后可用 --resume {runner.run_id} 继续）")
+
+    start_time = time.time()
+    batch_results = await runner.run(modules)
+
+    print(f"\n批量执行完成: {len(modules)} 个模块, 总耗时 {time.time() - start_time:.2f}s")
+    print("=" * 50)
+    for module, results in batch_results.items():
+        succeeded = sum(1 for result in results.values() if result.success)
+        status = "✅" if results and succeeded == len(results) else "❌"
+        print(f"{status} {module}: {succeeded}/{len(results)} 个步骤成功, "
+              f"输出目录: {runner.executors[module].workflow_config.output_dir}")
+
+
+async def main():
+    """主函数"""
+    args = parse_args()
+
+    # 加载配置
+    llm_configs, workflow_config = ConfigLoader.load_configs(
+        args.llm_config,
+        args.workflow_config
+    )
+    if args.no_cache:
+        workflow_config.use_cache = False
+    if args.stream:
+        workflow_config.stream = True
+    if args.quiet:
+        workflow_config.quiet = True
+
+    try:
+        if args.batch:
+            await run_batch(args.batch, workflow_config, llm_configs, args.batch_concurrency, args.resume)
+            return
+
+        # 创建执行器
+        executor = WorkflowExecutor(workflow_config, llm_configs, run_id=args.resume, resume=bool(args.resume))
+        print(f"运行ID: {executor.run_id}（中断后可用 --resume {executor.run_id} 继续）")
+
+        # 执行工作流
+        results = await executor.execute()
+    finally:
+        await LLMFactory.aclose_all()
+
+    # 打印结果摘要
+    print_summary(workflow_config, executor, results)
 
 
 if __name__ == "__main__":
@@ -1,6 +1,13 @@
 import os
 import re
+import json
+import time
 import shutil
+import hashlib
+import argparse
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from langchain_ollama.llms import OllamaLLM
@@ -49,66 +56,606 @@ optimization_prompt = PromptTemplate(
     """
 )
 
+# 大文件分片优化的 Prompt（只优化一个片段，其余片段并行优化后按原顺序拼接）
+chunk_optimization_prompt = PromptTemplate(
+    input_variables=["code", "filetype", "file_name", "index", "total", "external_symbols", "protected_symbols"],
+    template="""
+    你是一个代码优化专家。以下是 {filetype} 文件 {file_name} 的第 {index}/{total} 个片段（按语法边界切分，其余片段单独优化后按顺序拼接）：
+    ```
+    {code}
+    ```
+    在其他片段中定义的符号（不是未定义变量）：{external_symbols}
+    本片段中定义、被其他片段使用的符号（不得删除或重命名）：{protected_symbols}
+    任务：
+    1. 仅去除明确未被任何代码使用的变量和方法。
+    2. 修复潜在的 bug（如未定义变量、空指针等）。
+    3. 提升代码可读性（优化命名、结构、添加必要注释）。
+    4. 保留原有功能不变，确保不删除被直接调用、间接调用（通过 this、事件或模板）的方法。
+    只返回优化后的该片段代码，放在一个代码块中，不要补全片段之外的内容，不要改变片段的括号层次，并用注释说明改动原因。
+    """
+)
+
+# 修改块输出模式的 Prompt（只返回需要修改的片段，适合改动很少的文件）
+edit_optimization_prompt = PromptTemplate(
+    input_variables=["code", "filetype"],
+    template="""
+    你是一个代码优化专家。请分析以下 {filetype} 代码：
+    ```
+    {code}
+    ```
+    任务：
+    1. 仅去除明确未被任何代码使用的变量和方法。
+    2. 修复潜在的 bug（如未定义变量、空指针等）。
+    3. 提升代码可读性（优化命名、结构、添加必要注释）。
+    4. 保留原有功能不变，确保不删除被直接调用、间接调用（通过 this、事件或模板）的方法。
+    不要返回完整代码，只用以下格式返回需要修改的地方，每处修改一个块：
+    <<<<<<< SEARCH
+    原代码中需要修改的连续若干行（逐字复制，包括缩进，且在原代码中只出现一次）
+    =======
+    修改后的代码（用注释说明改动原因）
+    >>>>>>> REPLACE
+    不需要任何修改时只返回 NO_CHANGES。
+    """
+)
+
 # 创建 LangChain 调用链
 optimization_chain = optimization_prompt | llm
+chunk_optimization_chain = chunk_optimization_prompt | llm
+edit_optimization_chain = edit_optimization_prompt | llm
 
+# 输出模式: full 返回完整代码；edits 只返回修改块，在本地应用，失败时回退到 full
+OUTPUT_MODES = ("full", "edits")
 
-def backup_file_or_directory(path):
-    """备份文件或目录到当前目录下的 backup 文件夹"""
-    backup_dir = os.path.join(os.getcwd(), "backup")
-    if not os.path.exists(backup_dir):
-        os.makedirs(backup_dir)
+# 超过该字符数的文件按语法边界切分后并行优化，每个片段也尽量不超过该大小
+CHUNK_MAX_CHARS = 12000
+# 单个文件同时优化的片段数
+CHUNK_WORKERS = 8
 
-    backup_path = os.path.join(backup_dir, os.path.basename(path))
-    if os.path.isfile(path):
-        shutil.copy2(path, backup_path)
-    elif os.path.isdir(path):
-        shutil.copytree(path, backup_path, dirs_exist_ok=True)
-    print(f"已备份到: {backup_path}")
+# 所有模型调用共用的并发上限（文件级并发和片段级并发合计），process_path 按 max_workers 重新设置
+_llm_slots = threading.BoundedSemaphore(CHUNK_WORKERS)
 
 
-def optimize_code(file_path):
+def _invoke_llm(chain, inputs):
+    """在并发上限内调用模型"""
+    with _llm_slots:
+        return chain.invoke(inputs)
 
-    print(file_path)
-    """优化单个文件"""
-    with open(file_path, 'r', encoding='utf-8') as f:
-        original_code = f.read()
+# 优化清单：记录已优化文件的内容哈希、模型和提示词版本，再次运行时跳过未变化的文件
+MANIFEST_PATH = os.path.join(os.getcwd(), "optimize_manifest.json")
+MODEL_NAME = getattr(llm, "model_name", None) or getattr(llm, "model", "unknown")
+# 提示词版本取模板内容的哈希，修改提示词后所有文件会重新优化
+PROMPT_VERSION = hashlib.sha256(
+    (optimization_prompt.template + chunk_optimization_prompt.template + edit_optimization_prompt.template)
+    .encode("utf-8")).hexdigest()[:12]
 
 
-    # 根据文件类型调整处理逻辑
-    filetype = os.path.splitext(file_path)[1][1:]  # 提取文件扩展名，如 vue、py
-    if filetype not in ['vue', 'js','java']:  # 可扩展支持其他类型
-        print(f"暂不支持优化 .{filetype} 文件")
-        return
+# 备份目录: objects/ 按内容哈希存放文件（相同内容只存一份），snapshots/<时间戳>/ 中的文件是指向 objects 的硬链接
+BACKUP_DIR = os.path.join(os.getcwd(), "backup")
+OBJECTS_DIR = os.path.join(BACKUP_DIR, "objects")
+SNAPSHOTS_DIR = os.path.join(BACKUP_DIR, "snapshots")
+
+
+def _link_or_copy(src, dst):
+    """优先创建硬链接，文件系统不支持时复制"""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def backup_file_or_directory(path, files=None):
+    """备份即将被优化的文件，生成带时间戳的快照
 
-    print('-------------code1-------------------')
+    文件按内容哈希存入 backup/objects（已有相同内容时不再复制），快照中只创建硬链接，
+    备份耗时与待优化的文件数成正比，而不是整个目录的大小。
 
-    print(original_code)
-    print('-------------code2--------------------')
-    print('filetype-->',filetype)
+    参数:
+        path: 优化的文件或目录
+        files: 待优化的文件列表，默认为 path 下所有支持的文件
+
+    返回:
+        str: 快照ID，没有需要备份的文件时返回 None
+    """
+    files = collect_files(path) if files is None else files
+    if not files:
+        return None
+
+    snapshot_id = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    snapshot_dir = os.path.join(SNAPSHOTS_DIR, snapshot_id)
+    # 快照内的相对路径以 path 的上级目录为根，与原来 backup/<目录名>/... 的结构一致
+    source_root = os.path.dirname(os.path.abspath(path))
+
+    entries = {}
+    copied = 0
+    for file_path in files:
+        digest = file_hash(file_path)
+        object_path = os.path.join(OBJECTS_DIR, digest[:2], digest)
+        if not os.path.exists(object_path):
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            shutil.copy2(file_path, object_path + ".tmp")
+            os.replace(object_path + ".tmp", object_path)
+            copied += 1
+
+        relative_path = os.path.relpath(os.path.abspath(file_path), source_root)
+        snapshot_path = os.path.join(snapshot_dir, "files", relative_path)
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        _link_or_copy(object_path, snapshot_path)
+        entries[relative_path] = digest
+
+    with open(os.path.join(snapshot_dir, "snapshot.json"), 'w', encoding='utf-8') as f:
+        json.dump({"source_root": source_root, "path": os.path.abspath(path),
+                   "created": datetime.now().isoformat(timespec="seconds"), "files": entries},
+                  f, ensure_ascii=False, indent=1)
+    print(f"已备份 {len(entries)} 个文件（新增内容 {copied} 个）到快照: {snapshot_id}")
+    return snapshot_id
+
+
+def _load_snapshot(snapshot_id):
+    with open(os.path.join(SNAPSHOTS_DIR, snapshot_id, "snapshot.json"), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def list_snapshots():
+    """列出所有快照ID（按时间从旧到新）"""
+    if not os.path.isdir(SNAPSHOTS_DIR):
+        return []
+    return sorted(name for name in os.listdir(SNAPSHOTS_DIR)
+                  if os.path.isfile(os.path.join(SNAPSHOTS_DIR, name, "snapshot.json")))
+
+
+def restore_backup(snapshot_id=None, dry_run=False):
+    """把快照中的文件恢复到原位置
+
+    参数:
+        snapshot_id: 快照ID，默认为最近一次快照
+        dry_run: 只打印将要恢复的文件，不写入
+
+    返回:
+        list: 恢复的文件路径
+    """
+    snapshots = list_snapshots()
+    if not snapshots:
+        print("没有可恢复的快照")
+        return []
+    snapshot_id = snapshot_id or snapshots[-1]
+    if snapshot_id not in snapshots:
+        raise ValueError(f"快照不存在: {snapshot_id}")
+
+    snapshot = _load_snapshot(snapshot_id)
+    restored = []
+    for relative_path, digest in snapshot["files"].items():
+        target_path = os.path.join(snapshot["source_root"], relative_path)
+        if os.path.isfile(target_path) and file_hash(target_path) == digest:
+            continue
+        if not dry_run:
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            # 只复制内容，不改变目标文件的权限，也不与备份共享 inode
+            shutil.copyfile(os.path.join(OBJECTS_DIR, digest[:2], digest), target_path)
+        restored.append(target_path)
+        print(f"{'将恢复' if dry_run else '已恢复'}: {target_path}")
+
+    print(f"快照 {snapshot_id}: {'将恢复' if dry_run else '已恢复'} {len(restored)} 个文件，"
+          f"{len(snapshot['files']) - len(restored)} 个文件与快照一致")
+    return restored
+
+
+def file_hash(file_path):
+    """文件内容的 sha256"""
+    with open(file_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def load_manifest():
+    """读取优化清单 {绝对路径: {hash, model, prompt_version}}"""
+    try:
+        with open(MANIFEST_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+
+def save_manifest(manifest):
+    """原子写入优化清单"""
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def is_unchanged(manifest, file_path):
+    """文件自上次优化后内容未变，且模型和提示词版本相同"""
+    entry = manifest.get(os.path.abspath(file_path))
+    return bool(entry) and entry.get("model") == MODEL_NAME \
+        and entry.get("prompt_version") == PROMPT_VERSION and entry.get("hash") == file_hash(file_path)
+
+
+def _scan_lines(code):
+    """逐行扫描花括号层级，跳过字符串和注释
+
+    返回:
+        list: [(行内容, 行末层级, 行末是否处于字符串或块注释之外)]
+    """
+    lines = []
+    depth = 0
+    state = None  # None / 'block'（块注释）/ 引号字符
+    for line in code.splitlines(keepends=True):
+        i = 0
+        while i < len(line):
+            ch = line[i]
+            if state == 'block':
+                if line.startswith('*/', i):
+                    state = None
+                    i += 1
+            elif state:
+                if ch == '\\':
+                    i += 1
+                elif ch == state:
+                    state = None
+            elif line.startswith('//', i):
+                break
+            elif line.startswith('/*', i):
+                state = 'block'
+                i += 1
+            elif ch in '"\'`':
+                state = ch
+            elif ch == '{':
+                depth += 1
+            elif ch == '}':
+                depth -= 1
+            i += 1
+        # 单引号、双引号字符串不跨行
+        if state in ('"', "'"):
+            state = None
+        lines.append((line, depth, state is None))
+    return lines
+
+
+def _brace_delta(code):
+    """代码片段的花括号层级净变化"""
+    scanned = _scan_lines(code)
+    return scanned[-1][1] if scanned else 0
+
+
+def _merge_pieces(pieces, max_chars):
+    """把相邻的小片段合并为不超过 max_chars 的分片（单个超大片段单独成片）"""
+    chunks = []
+    for piece in pieces:
+        if chunks and len(chunks[-1]) + len(piece) <= max_chars:
+            chunks[-1] += piece
+        elif piece:
+            chunks.append(piece)
+    return chunks
+
+
+def _cut_lines(lines, boundaries):
+    """在边界行之后切开"""
+    pieces = []
+    start = 0
+    for index in boundaries:
+        pieces.append("".join(lines[start:index + 1]))
+        start = index + 1
+    pieces.append("".join(lines[start:]))
+    return [piece for piece in pieces if piece]
+
+
+def _split_braced(code, max_chars, max_depth=3):
+    """按花括号层级切分 Java/JS/CSS 代码
+
+    边界为层级不超过 D 的行末，且该行是空行或以 } ; , 结尾（类、方法、字段、对象属性的结束处）。
+    D 从 0 开始逐层加深，直到所有片段都不超过 max_chars。
+    """
+    scanned = _scan_lines(code)
+    lines = [line for line, _, _ in scanned]
+    pieces = [code]
+    for max_level in range(max_depth + 1):
+        boundaries = [index for index, (line, depth, closed) in enumerate(scanned)
+                      if closed and depth <= max_level and (not line.strip() or line.rstrip()[-1] in '};,')]
+        pieces = _cut_lines(lines, boundaries)
+        if max(len(piece) for piece in pieces) <= max_chars:
+            break
+    return pieces
 
-    # 调用大模型优化代码
-    optimized_result = optimization_chain.invoke({
+
+# 以闭合标签结尾的行，如 </div>、<p v-if="x">{{ x }}</p>、<Input v-model="a" />
+_TAG_LINE_END_PATTERN = re.compile(r'(?:</\w[\w-]*>|/>)\s*$')
+
+
+def _split_template(block, max_chars):
+    """按元素切分 Vue 的 template 块
+
+    边界为缩进不超过 N 且以闭合标签结尾的行（含单行元素），N 从最外层元素的缩进开始逐级加深，
+    直到所有片段都不超过 max_chars（根元素只有一个时会进入其子元素层）。
+    """
+    lines = block.splitlines(keepends=True)
+    closing = max((index for index, line in enumerate(lines) if line.strip().startswith('</template')),
+                  default=len(lines))
+    indents = sorted({len(line) - len(line.lstrip()) for line in lines[1:closing] if line.strip()})
+
+    pieces = [block]
+    for max_indent in indents:
+        boundaries = [index for index in range(1, closing)
+                      if len(lines[index]) - len(lines[index].lstrip()) <= max_indent
+                      and _TAG_LINE_END_PATTERN.search(lines[index])]
+        pieces = _cut_lines(lines, boundaries)
+        if max(len(piece) for piece in pieces) <= max_chars:
+            break
+    return pieces
+
+
+def split_source(code, filetype, max_chars=CHUNK_MAX_CHARS):
+    """按语法边界把源码切分为若干片段，拼接后与原文完全一致
+
+    Java/JS 在类、方法、字段的结束处切分；Vue 先按 <template>/<script>/<style> 块切分，
+    过大的块再按各自语法继续切分。切到最深一层仍可能有超过 max_chars 的片段，由调用方处理。
+    """
+    if len(code) <= max_chars:
+        return [code]
+
+    if filetype != 'vue':
+        return _merge_pieces(_split_braced(code, max_chars), max_chars)
+
+    starts = [m.start() for m in re.finditer(r'^<(?:template|script|style)\b', code, re.MULTILINE)]
+    starts = ([0] if not starts or starts[0] != 0 else []) + starts
+    blocks = [code[start:end] for start, end in zip(starts, starts[1:] + [len(code)])]
+
+    pieces = []
+    for block in blocks:
+        if len(block) <= max_chars:
+            pieces.append(block)
+        elif block.startswith('<template'):
+            pieces.extend(_split_template(block, max_chars))
+        else:
+            pieces.extend(_split_braced(block, max_chars))
+    return _merge_pieces(pieces, max_chars)
+
+
+_IDENTIFIER_PATTERN = re.compile(r'[A-Za-z_$][\w$]*')
+# 方法/函数、字段、变量声明
+_DECLARATION_PATTERNS = [
+    re.compile(r'^\s*(?:[\w<>\[\],?]+\s+)*?(\w+)\s*\([^;{}]*\)\s*(?:throws\s+[\w.,\s]+)?\{', re.MULTILINE),
+    re.compile(r'^\s*(\w+)\s*[:=]\s*(?:async\s+)?(?:function\b|\([^)]*\)\s*=>)', re.MULTILINE),
+    re.compile(r'^\s*(?:(?:public|private|protected|static|final)\s+)+[\w<>\[\],?\s]+?\b(\w+)\s*[;=]', re.MULTILINE),
+    re.compile(r'^\s*(?:export\s+)?(?:const|let|var|function|class)\s+(\w+)', re.MULTILINE),
+]
+_KEYWORDS = {"if", "for", "while", "switch", "catch", "return", "new", "else", "try", "do", "synchronized", "function"}
+
+
+def _declared_symbols(code):
+    """片段中声明的方法、字段和变量名"""
+    symbols = set()
+    for pattern in _DECLARATION_PATTERNS:
+        symbols.update(pattern.findall(code))
+    return symbols - _KEYWORDS
+
+
+def _extract_code(text):
+    """取模型输出中第一个代码块的内容，没有代码块时返回原文"""
+    match = re.search(r'```[^\n]*\n(.*?)```', text, re.DOTALL)
+    return match.group(1) if match else text
+
+
+def _optimize_chunks(file_path, chunks, filetype, skipped=()):
+    """并行优化各个片段并按原顺序拼接
+
+    每个片段附带共享符号上下文：其他片段中定义的符号，以及本片段中被其他片段引用的符号。
+    优化结果的花括号层级变化与原片段不一致时保留原片段；skipped 中的片段不发送给模型，保留原样。
+
+    返回:
+        tuple: (优化后的代码, 输入token数, 输出token数, 保留原样的片段数)
+    """
+    declared = [_declared_symbols(chunk) for chunk in chunks]
+    identifiers = [set(_IDENTIFIER_PATTERN.findall(chunk)) for chunk in chunks]
+
+    def optimize_chunk(index):
+        chunk = chunks[index]
+        if index in skipped:
+            return chunk, {}, False
+        others_declared = set().union(*(d for i, d in enumerate(declared) if i != index))
+        others_used = set().union(*(ids for i, ids in enumerate(identifiers) if i != index))
+        optimized_result = _invoke_llm(chunk_optimization_chain, {
+            "code": chunk,
+            "filetype": filetype,
+            "file_name": os.path.basename(file_path),
+            "index": index + 1,
+            "total": len(chunks),
+            "external_symbols": ", ".join(sorted(others_declared - declared[index])[:200]) or "无",
+            "protected_symbols": ", ".join(sorted(declared[index] & others_used)[:200]) or "无"
+        })
+        usage = getattr(optimized_result, 'usage_metadata', None) or {}
+        content = optimized_result.content if hasattr(optimized_result, 'content') else str(optimized_result)
+        optimized_chunk = _extract_code(content)
+        if chunk.endswith("\n") and not optimized_chunk.endswith("\n"):
+            optimized_chunk += "\n"
+        if _brace_delta(optimized_chunk) != _brace_delta(chunk):
+            return chunk, usage, False
+        return optimized_chunk, usage, True
+
+    with ThreadPoolExecutor(max_workers=min(CHUNK_WORKERS, len(chunks))) as pool:
+        outcomes = list(pool.map(optimize_chunk, range(len(chunks))))
+
+    optimized_code = "".join(chunk for chunk, _, _ in outcomes)
+    input_tokens = sum(usage.get("input_tokens", 0) for _, usage, _ in outcomes)
+    output_tokens = sum(usage.get("output_tokens", 0) for _, usage, _ in outcomes)
+    kept = sum(1 for _, _, accepted in outcomes if not accepted)
+    return optimized_code, input_tokens, output_tokens, kept
+
+
+_EDIT_BLOCK_PATTERN = re.compile(
+    r'^[ \t]*<{5,}[ \t]*SEARCH[ \t]*\n(.*?)^[ \t]*={5,}[ \t]*\n(.*?)^[ \t]*>{5,}[ \t]*REPLACE[ \t]*$',
+    re.DOTALL | re.MULTILINE)
+
+
+def parse_edits(text):
+    """解析 SEARCH/REPLACE 修改块
+
+    返回:
+        list: [(原代码, 修改后代码)]，模型回复 NO_CHANGES 时为空列表
+
+    异常:
+        ValueError: 回复中既没有修改块也不是 NO_CHANGES，或包含不完整的修改块
+    """
+    edits = [(search, replace) for search, replace in _EDIT_BLOCK_PATTERN.findall(text)]
+    if not edits:
+        if "NO_CHANGES" in text:
+            return []
+        raise ValueError("回复中没有修改块")
+    if len(re.findall(r'^[ \t]*<{5,}[ \t]*SEARCH', text, re.MULTILINE)) != len(edits):
+        raise ValueError("回复中有不完整的修改块")
+    return edits
+
+
+def apply_edits(code, edits):
+    """依次应用修改块，每个原代码片段必须在当前代码中恰好出现一次
+
+    异常:
+        ValueError: 原代码片段为空、找不到或出现多次
+    """
+    for index, (search, replace) in enumerate(edits, 1):
+        if not search.strip():
+            raise ValueError(f"第 {index} 个修改块的原代码为空")
+        count = code.count(search)
+        if count != 1:
+            raise ValueError(f"第 {index} 个修改块的原代码在文件中出现 {count} 次")
+        code = code.replace(search, replace, 1)
+    return code
+
+
+def _optimize_with_edits(original_code, filetype):
+    """用修改块模式优化代码
+
+    返回:
+        tuple: (优化后的代码，失败时为 None, 输入token数, 输出token数, 失败原因)
+    """
+    optimized_result = _invoke_llm(edit_optimization_chain, {
         "code": original_code,
         "filetype": filetype
     })
+    usage = getattr(optimized_result, 'usage_metadata', None) or {}
+    content = optimized_result.content if hasattr(optimized_result, 'content') else str(optimized_result)
+    input_tokens, output_tokens = usage.get("input_tokens", 0), usage.get("output_tokens", 0)
+
+    try:
+        optimized_code = apply_edits(original_code, parse_edits(content))
+    except ValueError as e:
+        return None, input_tokens, output_tokens, str(e)
+    # 修改后括号层次必须与原代码一致
+    if _brace_delta(optimized_code) != _brace_delta(original_code):
+        return None, input_tokens, output_tokens, "修改后花括号不匹配"
+    return optimized_code, input_tokens, output_tokens, None
+
+
+def optimize_code(file_path, verbose=True, output_mode="full"):
+    """优化单个文件
+
+    参数:
+        file_path: 文件路径
+        verbose: 是否打印原始代码和模型输出（并发处理时关闭，避免输出交错）
+        output_mode: full 返回完整代码；edits 只返回修改块（大文件分片优化时仍用完整输出）
+
+    返回:
+        dict: 处理结果 {path, status(optimized/skipped/failed), latency, input_tokens, output_tokens, error,
+              hash(写入后的内容哈希，有片段未优化时为 None，不记入清单以便下次重试)}
+    """
+    result = {"path": file_path, "status": "skipped", "latency": 0.0,
+              "input_tokens": 0, "output_tokens": 0, "error": None, "hash": None}
+    if verbose:
+        print(file_path)
 
-    print('---------------模型处理结果1---------------')
-    print(optimized_result)
-    print('---------------模型处理结果2---------------')
-
-    # 提取 AIMessage 的 content 属性
-    optimized_code = optimized_result.content if hasattr(optimized_result, 'content') else str(optimized_result)
+    with open(file_path, 'r', encoding='utf-8') as f:
+        original_code = f.read()
 
-    print('---------------优化后代码1--------------------')
 
-    print(optimized_code)
-    print('---------------优化后代码2--------------------')
+    # 根据文件类型调整处理逻辑
+    filetype = os.path.splitext(file_path)[1][1:]  # 提取文件扩展名，如 vue、py
+    if filetype not in ['vue', 'js','java']:  # 可扩展支持其他类型
+        print(f"暂不支持优化 .{filetype} 文件")
+        return result
+
+    if verbose:
+        print('-------------code1-------------------')
+
+        print(original_code)
+        print('-------------code2--------------------')
+        print('filetype-->',filetype)
+
+    # 大文件按语法边界切分后并行优化
+    if len(original_code) > CHUNK_MAX_CHARS:
+        chunks = split_source(original_code, filetype, CHUNK_MAX_CHARS)
+        # 切到最深一层仍然过大的片段不发送给模型，保留原样并报告
+        oversized = {index for index, chunk in enumerate(chunks) if len(chunk) > CHUNK_MAX_CHARS}
+        if oversized:
+            result["error"] = (f"{len(oversized)} 个片段无法切分到 {CHUNK_MAX_CHARS} 字符以内（"
+                               + ", ".join(f"第{index + 1}片 {len(chunks[index])} 字符" for index in sorted(oversized))
+                               + "），未发送给模型")
+            print(f"{file_path}: {result['error']}")
+        if len(oversized) == len(chunks):
+            return result
+
+        start = time.perf_counter()
+        optimized_code, result["input_tokens"], result["output_tokens"], kept = \
+            _optimize_chunks(file_path, chunks, filetype, oversized)
+        result["latency"] = time.perf_counter() - start
+        kept -= len(oversized)
+        print(f"分 {len(chunks)} 片优化: {file_path}" + (f"（{kept} 片结构校验未通过，保留原样）" if kept else ""))
+        with open(file_path, 'w', encoding='utf-8') as f:
+            f.write(optimized_code)
+        # 过大或校验未通过的片段仍是原样，不能把文件记为已优化
+        if not oversized and not kept:
+            result["hash"] = file_hash(file_path)
+        result["status"] = "optimized"
+        return result
+
+    start = time.perf_counter()
+    optimized_code = None
+    if output_mode == "edits":
+        optimized_code, result["input_tokens"], result["output_tokens"], error = \
+            _optimize_with_edits(original_code, filetype)
+        if optimized_code is None:
+            print(f"修改块应用失败（{error}），改用完整输出: {file_path}")
+        elif optimized_code == original_code:
+            # 无需修改，不重写文件
+            result["latency"] = time.perf_counter() - start
+            result["hash"] = file_hash(file_path)
+            result["status"] = "optimized"
+            if verbose:
+                print(f"无需修改: {file_path}")
+            return result
+
+    if optimized_code is None:
+        # 调用大模型优化代码
+        optimized_result = _invoke_llm(optimization_chain, {
+            "code": original_code,
+            "filetype": filetype
+        })
+
+        # 记录token用量（ChatOpenAI 返回 usage_metadata，本地 OllamaLLM 返回字符串，无用量信息）
+        usage = getattr(optimized_result, 'usage_metadata', None) or {}
+        result["input_tokens"] += usage.get("input_tokens", 0)
+        result["output_tokens"] += usage.get("output_tokens", 0)
+
+        # 提取 AIMessage 的 content 属性
+        optimized_code = optimized_result.content if hasattr(optimized_result, 'content') else str(optimized_result)
+
+        if verbose:
+            print('---------------模型处理结果1---------------')
+            print(optimized_result)
+            print('---------------模型处理结果2---------------')
+    result["latency"] = time.perf_counter() - start
+
+    if verbose:
+        print('---------------优化后代码1--------------------')
+
+        print(optimized_code)
+        print('---------------优化后代码2--------------------')
 
     # 保存优化后的代码
     with open(file_path, 'w', encoding='utf-8') as f:
         f.write(optimized_code)
-    print(f"已优化并保存: {file_path}")
+    result["hash"] = file_hash(file_path)
+    if verbose:
+        print(f"已优化并保存: {file_path}")
+    result["status"] = "optimized"
+    return result
 
 def remove_empty_lines(code):
     """删除空行，保留必要缩进"""
@@ -120,24 +667,153 @@ def remove_empty_lines(code):
 
 
 
-def process_path(path):
-    """处理文件或目录"""
-    # 备份
-    backup_file_or_directory(path)
-
-    # 处理文件或目录
+def collect_files(path):
+    """收集需要优化的文件列表"""
     if os.path.isfile(path):
-        optimize_code(path)
-    elif os.path.isdir(path):
-        for root, _, files in os.walk(path):
-            for file in files:
-                if file.endswith(('.vue', '.js','.java')):  # 只处理指定类型文件
-                    optimize_code(os.path.join(root, file))
-    else:
+        return [path]
+    files_to_optimize = []
+    for root, _, files in os.walk(path):
+        for file in files:
+            if file.endswith(('.vue', '.js','.java')):  # 只处理指定类型文件
+                files_to_optimize.append(os.path.join(root, file))
+    return files_to_optimize
+
+
+def print_summary(results, elapsed):
+    """打印耗时和token用量汇总"""
+    optimized = [r for r in results if r["status"] == "optimized"]
+    failed = [r for r in results if r["status"] == "failed"]
+    unchanged = [r for r in results if r["status"] == "unchanged"]
+    latencies = sorted(r["latency"] for r in optimized)
+
+    print("\n========== 优化汇总 ==========")
+    print(f"文件数: {len(results)}，已优化: {len(optimized)}，未变化: {len(unchanged)}，失败: {len(failed)}，"
+          f"跳过: {len(results) - len(optimized) - len(unchanged) - len(failed)}")
+    print(f"总耗时: {elapsed:.1f}s")
+    if latencies:
+        p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+        print(f"单文件耗时: 平均 {sum(latencies) / len(latencies):.1f}s，"
+              f"中位 {latencies[len(latencies) // 2]:.1f}s，P95 {p95:.1f}s，最长 {latencies[-1]:.1f}s")
+    print(f"token用量: 输入 {sum(r['input_tokens'] for r in results)}，"
+          f"输出 {sum(r['output_tokens'] for r in results)}（模型未返回用量时记为0）")
+
+    for r in sorted(optimized, key=lambda r: r["latency"], reverse=True)[:5]:
+        print(f"  {r['latency']:6.1f}s  输入 {r['input_tokens']:>7}  输出 {r['output_tokens']:>7}  {r['path']}")
+    for r in failed:
+        print(f"  失败: {r['path']} - {r['error']}")
+    for r in results:
+        if r["status"] != "failed" and r["error"]:
+            print(f"  未完整优化: {r['path']} - {r['error']}")
+
+
+def process_path(path, max_workers=1, use_manifest=True, output_mode="full"):
+    """处理文件或目录
+
+    参数:
+        path: 文件或目录路径
+        max_workers: 同时进行的模型调用数上限（含大文件的分片调用），大于1时用线程池并发优化文件（受模型接口限流约束，不宜过大）
+        use_manifest: 是否跳过自上次优化后未变化的文件
+        output_mode: full 让模型返回完整代码；edits 只返回修改块（改动少的文件输出token和耗时大幅减少）
+
+    返回:
+        list: 每个文件的处理结果
+    """
+    if output_mode not in OUTPUT_MODES:
+        raise ValueError(f"不支持的输出模式: {output_mode}，可选: {', '.join(OUTPUT_MODES)}")
+    if not os.path.exists(path):
         print(f"路径不存在: {path}")
+        return []
+
+    # 片段级并发也计入 max_workers，同时进行的模型调用不超过 max_workers 个
+    global _llm_slots
+    _llm_slots = threading.BoundedSemaphore(max(1, max_workers))
+
+    manifest = load_manifest() if use_manifest else {}
+    files = []
+    results = []
+    for file_path in collect_files(path):
+        if use_manifest and is_unchanged(manifest, file_path):
+            results.append({"path": file_path, "status": "unchanged", "latency": 0.0,
+                            "input_tokens": 0, "output_tokens": 0, "error": None, "hash": None})
+        else:
+            files.append(file_path)
+    if results:
+        print(f"跳过自上次优化后未变化的文件 {len(results)} 个，待优化 {len(files)} 个")
+
+    # 备份（只备份将被修改的文件）
+    backup_file_or_directory(path, files)
+
+    def record(result):
+        results.append(result)
+        if use_manifest and result["hash"]:
+            manifest[os.path.abspath(result["path"])] = {
+                "hash": result["hash"], "model": MODEL_NAME, "prompt_version": PROMPT_VERSION}
+
+    start = time.perf_counter()
+    try:
+        # 单个文件或串行模式保留详细输出
+        if max_workers <= 1 or len(files) <= 1:
+            for file_path in files:
+                record(_optimize_safely(file_path, True, output_mode))
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                futures = [pool.submit(_optimize_safely, file_path, False, output_mode) for file_path in files]
+                for done, future in enumerate(as_completed(futures), 1):
+                    result = future.result()
+                    record(result)
+                    print(f"[{done}/{len(files)}] {result['status']} {result['latency']:.1f}s {result['path']}")
+                    # 定期保存清单，中途中断时已优化的文件不必重做
+                    if use_manifest and done % 20 == 0:
+                        save_manifest(manifest)
+    finally:
+        if use_manifest:
+            save_manifest(manifest)
+
+    print_summary(results, time.perf_counter() - start)
+    return results
+
+
+def _optimize_safely(file_path, verbose, output_mode):
+    """优化单个文件，异常时记录为失败而不中断整批处理"""
+    try:
+        return optimize_code(file_path, verbose=verbose, output_mode=output_mode)
+    except Exception as e:
+        print(f"优化失败: {file_path} - {e}")
+        return {"path": file_path, "status": "failed", "latency": 0.0,
+                "input_tokens": 0, "output_tokens": 0, "error": str(e), "hash": None}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="智能检查优化项目代码")
+    subparsers = parser.add_subparsers(dest="command")
+
+    optimize_parser = subparsers.add_parser("optimize", help="优化文件或目录")
+    optimize_parser.add_argument("path", help="文件或目录路径")
+    optimize_parser.add_argument("--workers", type=int, default=8, help="同时优化的文件数")
+    optimize_parser.add_argument("--no-manifest", action="store_true", help="不跳过未变化的文件")
+    optimize_parser.add_argument("--output-mode", choices=OUTPUT_MODES, default="full",
+                                 help="full 返回完整代码；edits 只返回修改块，失败时回退到 full")
+
+    restore_parser = subparsers.add_parser("restore", help="从快照恢复文件")
+    restore_parser.add_argument("snapshot", nargs="?", help="快照ID，默认最近一次")
+    restore_parser.add_argument("--dry-run", action="store_true", help="只显示将恢复的文件")
+
+    subparsers.add_parser("snapshots", help="列出快照")
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    # 示例用法：优化指定文件或目录
-    target_path = "D:\\projects\\xxxWeb\\src\\pages\\finance\\order\\list.vue"  # 替换为你的文件或目录路径
-    process_path(target_path)
\ No newline at end of file
+    args = parse_args()
+    if args.command == "optimize":
+        process_path(args.path, max_workers=args.workers, use_manifest=not args.no_manifest,
+                     output_mode=args.output_mode)
+    elif args.command == "restore":
+        restore_backup(args.snapshot, dry_run=args.dry_run)
+    elif args.command == "snapshots":
+        for snapshot_id in list_snapshots():
+            snapshot = _load_snapshot(snapshot_id)
+            print(f"{snapshot_id}  {len(snapshot['files']):>5} 个文件  {snapshot['path']}")
+    else:
+        # 示例用法：优化指定文件或目录
+        target_path = "D:\\projects\\xxxWeb\\src\\pages\\finance\\order\\list.vue"  # 替换为你的文件或目录路径
+        process_path(target_path, max_workers=8)
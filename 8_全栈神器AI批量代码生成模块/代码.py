@@ -1,11 +1,236 @@
 import os
-from typing import Dict, List, Optional, Tuple, Union
+import re
+import json
+import time
+import asyncio
+import hashlib
+from typing import Any, Dict, List, Optional, Tuple, Union
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import StrOutputParser
+from langchain_core.runnables import RunnableLambda, RunnableParallel
 from common.my_llm import get_language_model
+from common.code_files import split_code_blocks, write_files, safe_join
 
 
 
+# 契约中的接口路径，如 /api/users/{id}（前面紧跟字母、数字或 / 的不算，排除 GET/POST、日期和URL）
+_ENDPOINT_PATH_PATTERN = re.compile(r'(?<![\w.:/])(/[A-Za-z][\w{}:.-]*(?:/[\w{}:.-]+)*)')
+
+
+def _hash_text(text: str) -> str:
+    """忽略空白差异的内容哈希"""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()[:16]
+
+
+def split_contract_endpoints(api_contract: str) -> Tuple[str, Dict[str, str]]:
+    """按接口路径拆分API契约。
+
+    出现新路径的行开始一个接口段（其前面三行内的标题行也归入该段），直到出现另一个路径为止；
+    同一路径的多个段（如端点列表和详细说明）合并在一起。
+
+    Args:
+        api_contract: API契约
+
+    Returns:
+        (第一个接口之前的公共部分, {接口路径: 接口段内容})
+    """
+    lines = api_contract.splitlines()
+    boundaries = []
+    current_path = None
+    for i, line in enumerate(lines):
+        match = _ENDPOINT_PATH_PATTERN.search(line)
+        if not match or match.group(1) == current_path:
+            continue
+        start = i
+        if not line.lstrip().startswith("#"):
+            # 接口的标题行通常紧挨在路径所在行之前
+            previous_start = boundaries[-1][0] if boundaries else -1
+            for j in range(i - 1, max(previous_start, i - 4), -1):
+                if lines[j].lstrip().startswith("#"):
+                    start = j
+                    break
+        boundaries.append((start, match.group(1)))
+        current_path = match.group(1)
+
+    if not boundaries:
+        return api_contract, {}
+
+    sections = {}
+    for index, (start, path) in enumerate(boundaries):
+        end = boundaries[index + 1][0] if index + 1 < len(boundaries) else len(lines)
+        sections.setdefault(path, []).extend(lines[start:end])
+    common = "\n".join(lines[:boundaries[0][0]])
+    return common, {path: "\n".join(section) for path, section in sections.items()}
+
+
+_HTTP_METHODS = ("GET", "POST", "PUT", "DELETE", "PATCH")
+# JSON契约中可直接使用、无需在 models 中定义的类型（小写的基本类型不检查）
+_BUILTIN_TYPES = {
+    "String", "Long", "Integer", "Int", "Short", "Byte", "Boolean", "Double", "Float", "BigDecimal", "Number",
+    "Date", "LocalDate", "LocalDateTime", "Object", "Void", "List", "Set", "Map", "Page", "PageResult", "Result"
+}
+_TYPE_NAME_PATTERN = re.compile(r'\b[A-Z]\w*')
+
+
+def parse_contract_json(text: str) -> Dict[str, Any]:
+    """解析并校验JSON格式的API契约。
+
+    Args:
+        text: LLM输出，允许包含 ```json 代码块标记
+
+    Returns:
+        契约字典 {"models": {...}, "endpoints": [...]}
+
+    Raises:
+        ValueError: 不是合法JSON或结构不符合要求
+    """
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("API契约中没有JSON对象")
+    try:
+        contract = json.loads(text[start:end + 1])
+    except json.JSONDecodeError as e:
+        raise ValueError(f"API契约不是合法JSON: {e}")
+
+    models = contract.setdefault("models", {})
+    endpoints = contract.get("endpoints")
+    if not isinstance(models, dict) or not all(isinstance(fields, dict) for fields in models.values()):
+        raise ValueError("API契约 models 应为 {模型名: {字段名: 类型}}")
+    if not isinstance(endpoints, list) or not endpoints:
+        raise ValueError("API契约 endpoints 应为非空列表")
+
+    errors = []
+    for index, endpoint in enumerate(endpoints):
+        if not isinstance(endpoint, dict):
+            errors.append(f"endpoints[{index}] 不是对象")
+            continue
+        method = str(endpoint.get("method", "")).upper()
+        path = endpoint.get("path")
+        if method not in _HTTP_METHODS:
+            errors.append(f"endpoints[{index}] method 无效: {endpoint.get('method')}")
+        if not isinstance(path, str) or not path.startswith("/"):
+            errors.append(f"endpoints[{index}] path 无效: {path}")
+        if not isinstance(endpoint.get("params") or {}, dict):
+            errors.append(f"endpoints[{index}] params 应为对象")
+        endpoint["method"] = method
+        for key in ("body", "response"):
+            for type_name in _TYPE_NAME_PATTERN.findall(str(endpoint.get(key) or "")):
+                if type_name not in models and type_name not in _BUILTIN_TYPES:
+                    errors.append(f"{method} {path} 的 {key} 引用了未定义的模型 {type_name}")
+    if errors:
+        raise ValueError("API契约校验失败: " + "; ".join(errors))
+    return contract
+
+
+def normalize_contract_json(text: str) -> str:
+    """校验JSON契约并压缩为不含多余空白的单行JSON"""
+    return json.dumps(parse_contract_json(text), ensure_ascii=False, separators=(",", ":"))
+
+
+def _render_endpoint(endpoint: Dict[str, Any], with_response: bool) -> str:
+    """单个接口渲染为一行，如 listUsers GET /api/users ?page:int,size:int -> Page<User> 分页查询"""
+    parts = [endpoint.get("name") or "", endpoint["method"], endpoint["path"]]
+    params = endpoint.get("params") or {}
+    if params:
+        parts.append("?" + ",".join(f"{name}:{type_name}" for name, type_name in params.items()))
+    if endpoint.get("body"):
+        parts.append(f"body:{endpoint['body']}")
+    if with_response and endpoint.get("response"):
+        parts.append(f"-> {endpoint['response']}")
+    if endpoint.get("summary"):
+        parts.append(endpoint["summary"])
+    return " ".join(part for part in parts if part)
+
+
+def render_contract(api_contract: str, consumer: str) -> str:
+    """按使用方把JSON契约渲染为最精简的文本。
+
+    backend / frontend 需要模型字段和返回类型；api_functions 只需要接口路径、方法和参数。
+
+    Args:
+        api_contract: normalize_contract_json 输出的JSON契约
+        consumer: backend、frontend 或 api_functions
+
+    Returns:
+        渲染后的契约文本
+    """
+    contract = parse_contract_json(api_contract)
+    lines = []
+    if consumer != "api_functions" and contract["models"]:
+        lines.append("模型:")
+        for name, fields in contract["models"].items():
+            lines.append(name + "{" + ",".join(f"{field}:{type_name}" for field, type_name in fields.items()) + "}")
+        lines.append("接口:")
+    for endpoint in contract["endpoints"]:
+        lines.append(_render_endpoint(endpoint, with_response=consumer != "api_functions"))
+    return "\n".join(lines)
+
+
+def _split_contract_json(api_contract: str) -> Optional[Tuple[str, Dict[str, str]]]:
+    """按接口拆分JSON契约（公共部分为模型定义），不是JSON契约时返回 None"""
+    try:
+        contract = parse_contract_json(api_contract)
+    except ValueError:
+        return None
+    common = json.dumps(contract["models"], ensure_ascii=False, sort_keys=True)
+    endpoints = {f"{endpoint['method']} {endpoint['path']}": json.dumps(endpoint, ensure_ascii=False, sort_keys=True)
+                 for endpoint in contract["endpoints"]}
+    return common, endpoints
+
+
+def diff_contracts(old_contract: str, new_contract: str) -> Dict[str, Any]:
+    """比较两版API契约中的接口，JSON契约按 方法+路径 比较，Markdown契约按路径比较。
+
+    Returns:
+        {"added": [...], "removed": [...], "changed": [...], "common_changed": bool}
+    """
+    old_split, new_split = _split_contract_json(old_contract), _split_contract_json(new_contract)
+    if old_split is None or new_split is None:
+        old_split, new_split = split_contract_endpoints(old_contract), split_contract_endpoints(new_contract)
+    old_common, old_endpoints = old_split
+    new_common, new_endpoints = new_split
+    return {
+        "added": [path for path in new_endpoints if path not in old_endpoints],
+        "removed": [path for path in old_endpoints if path not in new_endpoints],
+        "changed": [path for path in new_endpoints
+                    if path in old_endpoints and _hash_text(new_endpoints[path]) != _hash_text(old_endpoints[path])],
+        "common_changed": _hash_text(old_common) != _hash_text(new_common)
+    }
+
+
+class ContractCache:
+    """API契约缓存
+
+    每个模块一个JSON文件，记录:
+        contracts: {模型:需求描述哈希: API契约}，需求和模型都没变时直接复用契约
+        last: 最近一次生成结果（模型、契约、三部分代码），用于比对契约变化、复用未受影响的代码
+    """
+
+    def __init__(self, cache_dir: str, max_contracts: int = 20):
+        self.cache_dir = cache_dir
+        self.max_contracts = max_contracts
+
+    def _path(self, module_name: str) -> str:
+        return safe_join(self.cache_dir, f"{module_name}.json")
+
+    def load(self, module_name: str) -> Dict[str, Any]:
+        """读取模块缓存，不存在或损坏时返回空缓存"""
+        try:
+            with open(self._path(module_name), encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            state = {}
+        state.setdefault("contracts", {})
+        return state
+
+    def save(self, module_name: str, state: Dict[str, Any]) -> None:
+        """保存模块缓存，只保留最近 max_contracts 个契约"""
+        contracts = state["contracts"]
+        for key in list(contracts)[:-self.max_contracts]:
+            del contracts[key]
+        write_files({self._path(module_name): json.dumps(state, ensure_ascii=False, indent=2)})
+
+
 class Constants:
 
 
@@ -28,6 +253,35 @@ class Constants:
     请确保API设计符合RESTful规范，并适合前后端分离的架构。
     """
 
+    # 紧凑JSON格式的API契约提示词（contract_format="json" 时使用，下游按需渲染，节省提示词token）
+    API_CONTRACT_JSON_PROMPT_TEMPLATE = """为{module_name}模块设计API契约，只输出一个紧凑的JSON对象，不要输出任何解释。
+
+    该模块的主要功能是：{module_description}
+
+    JSON结构：
+    {{"models": {{"模型名": {{"字段名": "Java类型"}}}},
+     "endpoints": [{{"name": "函数名", "method": "GET|POST|PUT|DELETE", "path": "/api/...", "summary": "简短说明",
+                    "params": {{"参数名": "类型"}}, "body": "模型名或null", "response": "返回类型"}}]}}
+
+    要求：
+    1. 符合RESTful规范，路径参数写在path中，如 /api/users/{{id}}
+    2. body 和 response 中引用的模型必须在 models 中定义，可使用 List<模型>、Page<模型> 包装
+    3. 不要输出注释、示例数据和多余空白
+    """
+
+    # API契约增量更新提示词（需求描述变化时，在上一版契约基础上修改，未受影响的接口保持原样便于比对）
+    API_CONTRACT_UPDATE_PROMPT_TEMPLATE = """{module_name}模块的需求有变化，请在已有API契约的基础上更新契约。
+
+    更新后的模块功能是：{module_description}
+
+    已有API契约:
+    {previous_contract}
+
+    要求：
+    1. 只修改受需求变化影响的API，未受影响的API内容保持原文不变
+    2. 输出完整的更新后契约，格式与已有契约一致
+    """
+
     # 后端代码生成提示词
     BACKEND_SYSTEM_PROMPT = """你是一位专业的Java后端开发工程师，精通Spring Boot2框架。
     你的任务是根据提供的API契约，编写符合规范的Java控制器代码，确保代码风格一致、注释完善。"""
@@ -85,14 +339,30 @@ class Constants:
 
 
 class CodeGenerator:
-    def __init__(self, llm_name: Optional[str] = None):
+    # 只依赖接口定义（路径、方法、参数）的代码，契约公共部分变化时不需要重新生成
+    ENDPOINT_ONLY_CODES = ("api_functions",)
+
+    CONTRACT_FORMATS = ("markdown", "json")
+
+    def __init__(self,
+                 llm_name: Optional[str] = None,
+                 cache_dir: Optional[str] = None,
+                 contract_format: str = "markdown"):
         """初始化代码生成器。
 
         Args:
             llm_name: 模型名称
+            cache_dir: API契约缓存目录（如 "./.codegen_cache"），为 None 时不使用缓存
+            contract_format: API契约格式，markdown 原样传给下游；
+                json 生成紧凑JSON并校验，按后端、前端、API函数分别渲染出所需的最少内容
         """
+        if contract_format not in self.CONTRACT_FORMATS:
+            raise ValueError(f"不支持的契约格式: {contract_format}，可选: {', '.join(self.CONTRACT_FORMATS)}")
+        self.contract_format = contract_format
         self.constants = Constants()
+        self.llm_name = llm_name or "default"
         self.llm = get_language_model(llm_name)
+        self.cache = ContractCache(cache_dir) if cache_dir else None
 
 
         # 初始化输出解析器
@@ -102,13 +372,20 @@ class CodeGenerator:
         self._init_prompt_templates()
 
     def _init_prompt_templates(self):
-        """初始化各种提示模板"""
+        """初始化各种提示模板，并组装好调用链（批量生成时不再重复构建）"""
         # API契约提示模板
         self.api_contract_prompt = PromptTemplate(
-            template=self.constants.API_CONTRACT_PROMPT_TEMPLATE,
+            template=self.constants.API_CONTRACT_JSON_PROMPT_TEMPLATE if self.contract_format == "json"
+            else self.constants.API_CONTRACT_PROMPT_TEMPLATE,
             input_variables=["module_name", "module_description"]
         )
 
+        # API契约增量更新提示模板
+        self.api_contract_update_prompt = PromptTemplate(
+            template=self.constants.API_CONTRACT_UPDATE_PROMPT_TEMPLATE,
+            input_variables=["module_name", "module_description", "previous_contract"]
+        )
+
         # 后端代码提示模板
         self.backend_prompt = PromptTemplate(
             template=self.constants.BACKEND_PROMPT_TEMPLATE,
@@ -127,6 +404,41 @@ class CodeGenerator:
             input_variables=["module_name", "api_contract"]
         )
 
+        # 调用链
+        self.api_contract_chain = self.api_contract_prompt | self.llm | self.output_parser
+        self.api_contract_update_chain = self.api_contract_update_prompt | self.llm | self.output_parser
+        self.backend_chain = self.backend_prompt | self.llm | self.output_parser
+        self.frontend_chain = self.frontend_prompt | self.llm | self.output_parser
+        self.api_functions_chain = self.api_functions_prompt | self.llm | self.output_parser
+
+        if self.contract_format == "json":
+            # 契约输出校验失败时重新生成一次；下游只接收各自需要的渲染结果
+            validate = RunnableLambda(normalize_contract_json)
+            self.api_contract_chain = (self.api_contract_chain | validate).with_retry(
+                retry_if_exception_type=(ValueError,), stop_after_attempt=2)
+            self.api_contract_update_chain = (self.api_contract_update_chain | validate).with_retry(
+                retry_if_exception_type=(ValueError,), stop_after_attempt=2)
+            self.backend_chain = self._contract_renderer("backend") | self.backend_chain
+            self.frontend_chain = self._contract_renderer("frontend") | self.frontend_chain
+            self.api_functions_chain = self._contract_renderer("api_functions") | self.api_functions_chain
+
+        self.code_chains = {
+            "backend_code": self.backend_chain,
+            "frontend_code": self.frontend_chain,
+            "api_functions": self.api_functions_chain
+        }
+        self.code_chain = RunnableParallel(self.code_chains)
+
+        # 提示模板变化后，缓存的契约和代码都不能再复用
+        self.prompt_hash = _hash_text("\n".join(prompt.template for prompt in (
+            self.api_contract_prompt, self.api_contract_update_prompt,
+            self.backend_prompt, self.frontend_prompt, self.api_functions_prompt)))
+
+    @staticmethod
+    def _contract_renderer(consumer: str):
+        """把输入中的JSON契约替换为 consumer 所需的渲染结果"""
+        return RunnableLambda(lambda inputs: {**inputs, "api_contract": render_contract(inputs["api_contract"], consumer)})
+
     def generate_api_contract(self, module_name: str, module_description: str) -> str:
         """生成API契约。
 
@@ -137,9 +449,7 @@ class CodeGenerator:
         Returns:
             生成的API契约
         """
-        chain = self.api_contract_prompt | self.llm | self.output_parser
-
-        return chain.invoke({
+        return self.api_contract_chain.invoke({
             "module_name": module_name,
             "module_description": module_description
         })
@@ -154,10 +464,7 @@ class CodeGenerator:
         Returns:
             生成的后端代码
         """
-        chain =self.backend_prompt | self.llm | self.output_parser
-
-
-        return chain.invoke({
+        return self.backend_chain.invoke({
             "module_name": module_name,
             "api_contract": api_contract
         })
@@ -172,10 +479,7 @@ class CodeGenerator:
         Returns:
             生成的前端代码
         """
-        chain =self.frontend_prompt | self.llm | self.output_parser
-
-
-        return chain.invoke({
+        return self.frontend_chain.invoke({
             "module_name": module_name,
             "api_contract": api_contract
         })
@@ -190,9 +494,7 @@ class CodeGenerator:
         Returns:
             生成的API请求函数代码
         """
-        chain = self.api_functions_prompt | self.llm | self.output_parser
-
-        return chain.invoke({
+        return self.api_functions_chain.invoke({
             "module_name": module_name,
             "api_contract": api_contract
         })
@@ -200,6 +502,9 @@ class CodeGenerator:
     def generate_full_stack_code(self, module_name: str, module_description: str) -> Dict[str, str]:
         """生成完整的全栈代码。
 
+        需求描述和模型都未变化时复用缓存的API契约；需求变化时在上一版契约基础上增量更新，
+        再按接口比对新旧契约，只重新生成受影响的代码。
+
         Args:
             module_name: 模块名称
             module_description: 模块功能描述
@@ -207,30 +512,189 @@ class CodeGenerator:
         Returns:
             包含所有生成代码的字典
         """
-        # 1. 生成API契约
-        api_contract = self.generate_api_contract(module_name, module_description)
-        print(f"✅ API契约生成完成")
+        state = self._load_cache(module_name)
+        contract_key = self._contract_key(module_description)
+
+        # 1. 生成API契约（需求和模型未变时复用缓存）
+        api_contract = state["contracts"].get(contract_key)
+        if api_contract is None:
+            chain, inputs = self._contract_request(module_name, module_description, state)
+            api_contract = chain.invoke(inputs)
+            print(f"✅ API契约生成完成")
+        else:
+            print(f"✅ 命中API契约缓存")
+
+        # 2. 并行生成受契约变化影响的代码，其余复用上次结果
+        chain, codes = self._plan_regeneration(module_name, state, api_contract)
+        if chain is not None:
+            codes.update(chain.invoke({
+                "module_name": module_name,
+                "api_contract": api_contract
+            }))
+            print(f"✅ 代码生成完成")
+
+        self._update_cache(module_name, state, contract_key, api_contract, codes)
 
-        # 2. 生成后端代码
-        backend_code = self.generate_backend_code(module_name, api_contract)
-        print(f"✅ 后端代码生成完成")
+        # 返回所有生成的代码
+        return {"api_contract": api_contract, **codes}
 
-        # 3. 生成前端Vue组件
-        frontend_code = self.generate_frontend_code(module_name, api_contract)
-        print(f"✅ 前端Vue组件生成完成")
+    async def agenerate_api_contract(self, module_name: str, module_description: str) -> str:
+        """异步生成API契约。"""
+        return await self.api_contract_chain.ainvoke({
+            "module_name": module_name,
+            "module_description": module_description
+        })
 
-        # 4. 生成API请求函数
-        api_functions = self.generate_api_functions(module_name, api_contract)
-        print(f"✅ API请求函数生成完成")
+    async def agenerate_full_stack_code(self, module_name: str, module_description: str) -> Dict[str, str]:
+        """异步生成完整的全栈代码。
 
-        # 返回所有生成的代码
-        return {
-            "api_contract": api_contract,
-            "backend_code": backend_code,
-            "frontend_code": frontend_code,
-            "api_functions": api_functions
+        后端代码、前端组件和API请求函数只依赖API契约，契约生成后三者并发生成，
+        单个模块的耗时约为 契约 + 三者中最慢的一个。
+
+        Args:
+            module_name: 模块名称
+            module_description: 模块功能描述
+
+        Returns:
+            包含所有生成代码的字典
+        """
+        state = await asyncio.to_thread(self._load_cache, module_name)
+        contract_key = self._contract_key(module_description)
+
+        # 1. 生成API契约（需求和模型未变时复用缓存）
+        api_contract = state["contracts"].get(contract_key)
+        if api_contract is None:
+            chain, inputs = self._contract_request(module_name, module_description, state)
+            api_contract = await chain.ainvoke(inputs)
+            print(f"✅ [{module_name}] API契约生成完成")
+        else:
+            print(f"✅ [{module_name}] 命中API契约缓存")
+
+        # 2. 并发生成受契约变化影响的代码，其余复用上次结果
+        chain, codes = self._plan_regeneration(module_name, state, api_contract)
+        if chain is not None:
+            codes.update(await chain.ainvoke({
+                "module_name": module_name,
+                "api_contract": api_contract
+            }))
+            print(f"✅ [{module_name}] 代码生成完成")
+
+        await asyncio.to_thread(self._update_cache, module_name, state, contract_key, api_contract, codes)
+
+        return {"api_contract": api_contract, **codes}
+
+    async def agenerate_batch(self,
+                              modules: Dict[str, str],
+                              output_dir: Optional[str] = None,
+                              max_concurrency: int = 4) -> Dict[str, Dict[str, str]]:
+        """批量异步生成多个模块的全栈代码。
+
+        Args:
+            modules: {模块名称: 模块功能描述}
+            output_dir: 输出目录，指定时每个模块生成后保存到 output_dir/模块名称
+            max_concurrency: 同时生成的模块数上限（每个模块最多同时发起3个LLM请求）
+
+        Returns:
+            {模块名称: 生成代码的字典}，生成失败的模块不包含在内
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def generate_module(module_name: str, module_description: str):
+            async with semaphore:
+                start = time.perf_counter()
+                codes = await self.agenerate_full_stack_code(module_name, module_description)
+                if output_dir:
+                    await asyncio.to_thread(self.save_code_to_files, module_name,
+                                            os.path.join(output_dir, module_name), codes)
+                print(f"⏱️ [{module_name}] 耗时 {time.perf_counter() - start:.1f}s")
+                return codes
+
+        names = list(modules)
+        outcomes = await asyncio.gather(
+            *(generate_module(name, modules[name]) for name in names),
+            return_exceptions=True
+        )
+
+        results = {}
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, BaseException):
+                print(f"❌ [{name}] 生成失败: {outcome}")
+            else:
+                results[name] = outcome
+        print(f"✅ 批量生成完成: 成功 {len(results)}/{len(names)} 个模块")
+        return results
+
+    def _load_cache(self, module_name: str) -> Dict[str, Any]:
+        """读取模块的契约缓存，未启用缓存时返回空缓存"""
+        return self.cache.load(module_name) if self.cache else {"contracts": {}}
+
+    def _contract_key(self, module_description: str) -> str:
+        """契约缓存键: 模型 + 契约格式 + 提示模板哈希 + 需求描述哈希"""
+        return f"{self.llm_name}:{self.contract_format}:{self.prompt_hash}:{_hash_text(module_description)}"
+
+    def _is_reusable(self, last: Optional[Dict[str, Any]]) -> bool:
+        """上次生成结果是否由相同模型、契约格式和提示模板产生，可用于增量更新"""
+        return bool(last) and last.get("model") == self.llm_name \
+            and last.get("contract_format", "markdown") == self.contract_format \
+            and last.get("prompt_hash") == self.prompt_hash
+
+    def _contract_request(self, module_name: str, module_description: str, state: Dict[str, Any]):
+        """选择契约生成链：有同一模型的上一版契约时增量更新，否则从头生成"""
+        last = state.get("last")
+        if self._is_reusable(last):
+            return self.api_contract_update_chain, {
+                "module_name": module_name,
+                "module_description": module_description,
+                "previous_contract": last["api_contract"]
+            }
+        return self.api_contract_chain, {
+            "module_name": module_name,
+            "module_description": module_description
         }
 
+    def _plan_regeneration(self, module_name: str, state: Dict[str, Any], api_contract: str):
+        """比对新旧契约，确定需要重新生成的代码
+
+        Returns:
+            (需要重新生成部分的并行链，全部复用时为 None, 复用的代码字典)
+        """
+        last = state.get("last")
+        if not self._is_reusable(last):
+            return self.code_chain, {}
+
+        diff = diff_contracts(last["api_contract"], api_contract)
+        endpoints_changed = bool(diff["added"] or diff["removed"] or diff["changed"])
+        print(f"🔍 [{module_name}] 契约变化: 新增 {diff['added']}, 删除 {diff['removed']}, "
+              f"修改 {diff['changed']}, 公共部分{'有' if diff['common_changed'] else '无'}变化")
+
+        regenerate = []
+        reused = {}
+        for key in self.code_chains:
+            affected = endpoints_changed or (diff["common_changed"] and key not in self.ENDPOINT_ONLY_CODES)
+            if affected or key not in last.get("codes", {}):
+                regenerate.append(key)
+            else:
+                reused[key] = last["codes"][key]
+        if reused:
+            print(f"♻️ [{module_name}] 复用未受影响的代码: {', '.join(reused)}")
+
+        if not regenerate:
+            return None, reused
+        if len(regenerate) == len(self.code_chains):
+            return self.code_chain, reused
+        return RunnableParallel({key: self.code_chains[key] for key in regenerate}), reused
+
+    def _update_cache(self, module_name: str, state: Dict[str, Any], contract_key: str,
+                      api_contract: str, codes: Dict[str, str]) -> None:
+        """记录本次生成的契约和代码"""
+        if not self.cache:
+            return
+        state["contracts"].pop(contract_key, None)
+        state["contracts"][contract_key] = api_contract
+        state["last"] = {"model": self.llm_name, "contract_format": self.contract_format,
+                         "prompt_hash": self.prompt_hash, "api_contract": api_contract, "codes": codes}
+        self.cache.save(module_name, state)
+
     def save_code_to_files(self,
                            module_name: str,
                            output_dir: str,
@@ -242,30 +706,42 @@ class CodeGenerator:
             output_dir: 输出目录
             code_dict: 包含所有生成代码的字典
         """
-        # 创建必要的目录
-        backend_dir = os.path.join(output_dir, "backend", "src", "main", "java", "com", "example", "demo")
-        frontend_dir = os.path.join(output_dir, "frontend", "src")
+        backend_root = os.path.join(output_dir, "backend")
+        frontend_root = os.path.join(output_dir, "frontend")
+        backend_dir = os.path.join(backend_root, "src", "main", "java", "com", "example", "demo")
+        frontend_dir = os.path.join(frontend_root, "src")
         api_dir = os.path.join(frontend_dir, "api")
 
-        os.makedirs(backend_dir, exist_ok=True)
-        os.makedirs(frontend_dir, exist_ok=True)
-        os.makedirs(api_dir, exist_ok=True)
-
-        # 保存API契约
-        with open(os.path.join(output_dir, f"{module_name}_api_contract.md"), "w",encoding='utf-8') as f:
-            f.write(code_dict["api_contract"])
-
-        # 保存后端代码 - 这里简化处理，实际上可能需要解析代码并分别保存到不同文件
-        with open(os.path.join(backend_dir, f"{module_name.capitalize()}Controller.java"), "w",encoding='utf-8') as f:
-            f.write(code_dict["backend_code"])
-
-        # 保存前端Vue组件
-        with open(os.path.join(frontend_dir, f"{module_name.capitalize()}.vue"), "w",encoding='utf-8') as f:
-            f.write(code_dict["frontend_code"])
-
-        # 保存API请求函数
-        with open(os.path.join(api_dir, f"{module_name}.js"), "w",encoding='utf-8') as f:
-            f.write(code_dict["api_functions"])
+        # API契约
+        if self.contract_format == "json":
+            contract_text = json.dumps(parse_contract_json(code_dict["api_contract"]), ensure_ascii=False, indent=2)
+            files = {os.path.join(output_dir, f"{module_name}_api_contract.json"): contract_text}
+        else:
+            files = {os.path.join(output_dir, f"{module_name}_api_contract.md"): code_dict["api_contract"]}
+
+        # 各部分代码: (代码键, 默认目录, 带目录的路径的根目录, 未拆分出文件时使用的文件名)
+        targets = [
+            ("backend_code", backend_dir, backend_root, f"{module_name.capitalize()}Controller.java"),
+            ("frontend_code", frontend_dir, frontend_root, f"{module_name.capitalize()}.vue"),
+            ("api_functions", api_dir, frontend_root, f"{module_name}.js"),
+        ]
+        for key, default_dir, root_dir, fallback_name in targets:
+            blocks = split_code_blocks(code_dict[key])
+            if not blocks:
+                # 没有带文件名的代码块时整体保存为单个文件
+                files[os.path.join(default_dir, fallback_name)] = code_dict[key]
+                continue
+            for file_path, content in blocks:
+                # 只有文件名的放到默认目录，带目录的路径相对于前端/后端根目录
+                base_dir = root_dir if "/" in file_path else default_dir
+                try:
+                    files[safe_join(base_dir, file_path)] = content
+                except ValueError as e:
+                    print(f"⚠️ 跳过文件: {e}")
+
+        # 并行写入，内容未变化的文件不重写
+        written, unchanged = write_files(files)
+        print(f"📁 共 {len(files)} 个文件，写入 {len(written)} 个，未变化 {len(unchanged)} 个")
 
         print(f"✅ 所有代码已保存到 {output_dir} 目录")
 
@@ -277,6 +753,10 @@ def main():
     """
     # generator = CodeGenerator('qwen2.5-coder')
     generator = CodeGenerator('deepseek-chat')
+    # 使用紧凑JSON契约，下游提示词只包含各自需要的部分
+    # generator = CodeGenerator('deepseek-chat', contract_format="json")
+    # 缓存API契约，需求修改后增量更新契约并只重新生成受影响的代码
+    # generator = CodeGenerator('deepseek-chat', cache_dir="./.codegen_cache")
 
     # 定义模块信息
     module_name = "user"
@@ -300,13 +780,17 @@ def main():
     5. 删除用户
     """
 
-    # 生成完整的全栈代码
-    codes = generator.generate_full_stack_code(module_name, module_description)
+    # 生成完整的全栈代码（契约生成后，前后端代码并发生成）
+    codes = asyncio.run(generator.agenerate_full_stack_code(module_name, module_description))
 
     # 保存代码到文件
     output_dir = "./generated_code"
     generator.save_code_to_files(module_name, output_dir, codes)
 
+    # 批量生成多个模块（最多同时生成 max_concurrency 个模块）
+    # asyncio.run(generator.agenerate_batch({"user": module_description, "order": "订单管理模块..."},
+    #                                       output_dir=output_dir, max_concurrency=4))
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,44 @@
+"""
+common.my_llm 启动耗时对比
+
+before: 旧版行为，import 时立即构建默认模型（等价于 import 后访问 language_model）
+after : 新版行为，import 时不构建任何模型
+
+每轮都在独立子进程中执行，避免模块缓存影响结果。
+用法（在仓库根目录执行）: python -m common.bench_my_llm
+"""
+import statistics
+import subprocess
+import sys
+
+ROUNDS = 5
+
+SCRIPTS = {
+    "before": (
+        "import time; t = time.perf_counter(); "
+        "import common.my_llm as m; m.language_model; "
+        "print(time.perf_counter() - t)"
+    ),
+    "after": (
+        "import time; t = time.perf_counter(); "
+        "import common.my_llm; "
+        "print(time.perf_counter() - t)"
+    ),
+}
+
+
+def measure(script):
+    """在子进程中执行脚本，返回耗时（秒）"""
+    output = subprocess.check_output([sys.executable, "-c", script], text=True)
+    return float(output.strip().splitlines()[-1])
+
+
+def main():
+    for name, script in SCRIPTS.items():
+        samples = [measure(script) for _ in range(ROUNDS)]
+        print(f"{name:<6}: 中位数 {statistics.median(samples) * 1000:.1f} ms "
+              f"(最小 {min(samples) * 1000:.1f} ms, {ROUNDS} 轮)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+import os
+import re
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# 识别为代码文件名的扩展名
+CODE_FILE_EXTENSIONS = (
+    "java", "xml", "vue", "js", "jsx", "ts", "tsx", "yml", "yaml", "sql", "json",
+    "properties", "css", "scss", "less", "html", "py", "md", "sh"
+)
+
+_FILE_PATH = r'((?:[\w.-]+/)*[\w.-]+\.(?:' + "|".join(CODE_FILE_EXTENSIONS) + r'))'
+_FILE_NAME_PATTERN = re.compile(r'(?<![\w./-])' + _FILE_PATH + r'\b')
+# 只包含文件名的标题行：### 1. UserController.java、**User.vue**、=== User.java ===、文件: a/b.js、裸路径
+_FILE_LABEL_PATTERN = re.compile(
+    r'^\s*(?:#{1,6}\s*|\*\*|={3,}\s*)?(?:\d+[.、)]\s*)?(?:(?:file(?:name)?|文件)\s*[:：]\s*)?'
+    r'[`*]*' + _FILE_PATH + r'[`*]*\s*(?:={3,}|\*\*)?\s*[:：]?\s*$',
+    re.IGNORECASE
+)
+# 命令行代码块，其中的内容不是文件内容（除非文件本身是 .sh）
+_SHELL_LANGUAGES = {"bash", "sh", "shell", "console", "zsh", "powershell", "ps", "cmd", "bat"}
+_FENCE_PATTERN = re.compile(r'^[ \t]*(`{3,}|~{3,})[ \t]*([^\n]*)$', re.MULTILINE)
+# 代码块第一行中的文件名注释，如 // UserController.java、<!-- User.vue -->、# application.yml
+_COMMENT_HEADER_PATTERN = re.compile(r'^\s*(?://|#|<!--|/\*|--)\s*(?:file(?:name)?\s*[:：]\s*|文件\s*[:：]\s*)?(\S+)')
+
+
+def _find_file_name(text):
+    """从标题行中提取文件路径，找不到返回 None"""
+    match = _FILE_NAME_PATTERN.search(text or "")
+    return match.group(1) if match else None
+
+
+def split_code_blocks(text):
+    """
+    从LLM输出中拆分出带文件名的代码块
+
+    文件名按以下顺序查找：
+        1. 代码块标记行，如 ```java:src/main/java/User.java 或 ```vue title="User.vue"
+        2. 代码块之前最近的非空行且只包含文件名，如 ### UserController.java、**User.vue**、=== User.java ===
+        3. 代码块第一行的注释，如 // UserController.java
+
+    参数:
+        text (str): LLM输出
+
+    返回:
+        list: [(文件路径, 文件内容)]，同名文件以最后一个代码块为准，
+              未找到文件名的代码块和与文件类型不符的命令行代码块（bash、sh 等）被忽略
+    """
+    files = {}
+    position = 0
+    fences = list(_FENCE_PATTERN.finditer(text or ""))
+
+    index = 0
+    while index < len(fences):
+        opening = fences[index]
+        # 查找配对的结束标记（同类且不短于开始标记、无语言信息）
+        closing_index = None
+        for j in range(index + 1, len(fences)):
+            fence = fences[j]
+            if fence.group(1)[0] == opening.group(1)[0] and len(fence.group(1)) >= len(opening.group(1)) \
+                    and not fence.group(2).strip():
+                closing_index = j
+                break
+        if closing_index is None:
+            break
+        closing = fences[closing_index]
+
+        content = text[opening.end() + 1:closing.start()]
+        # 标记行中单独的语言名（如 java）不带扩展名，不会被识别为文件名
+        file_name = _find_file_name(opening.group(2))
+
+        if not file_name:
+            # 前一行必须只包含文件名，避免把说明文字中提到的文件（如“修改 pom.xml 后执行”）当成文件名
+            preceding = text[position:opening.start()].rstrip().rsplit("\n", 1)[-1]
+            label = _FILE_LABEL_PATTERN.match(preceding)
+            file_name = label.group(1) if label else None
+
+        if not file_name:
+            first_line = content.split("\n", 1)[0]
+            header = _COMMENT_HEADER_PATTERN.match(first_line)
+            if header:
+                file_name = _find_file_name(header.group(1))
+
+        # 命令行代码块只能对应 .sh 文件
+        language = re.split(r'[\s:{]', opening.group(2).strip(), 1)[0].lower()
+        if file_name and language in _SHELL_LANGUAGES and not file_name.endswith(".sh"):
+            file_name = None
+
+        if file_name:
+            files[re.sub(r'^(\./)+', '', file_name)] = content.rstrip() + "\n"
+
+        position = closing.end()
+        index = closing_index + 1
+
+    return list(files.items())
+
+
+def _content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _write_if_changed(path, content):
+    """内容哈希未变化时跳过写入，返回是否写入"""
+    data = content.encode("utf-8")
+    if os.path.isfile(path) and os.path.getsize(path) == len(data):
+        with open(path, "rb") as f:
+            if _content_hash(f.read()) == _content_hash(data):
+                return False
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+def safe_join(base_dir, relative_path):
+    """
+    拼接输出路径，拒绝跳出 base_dir 的路径（如 ../ 或绝对路径）
+
+    :raises: ValueError 路径越界
+    """
+    relative_path = relative_path.replace("\\", "/").lstrip("/")
+    base = os.path.abspath(base_dir)
+    path = os.path.abspath(os.path.join(base, relative_path))
+    if os.path.commonpath([base, path]) != base:
+        raise ValueError(f"输出路径越界: {relative_path}")
+    return path
+
+
+def write_files(files, max_workers=8):
+    """
+    并行写入文件，内容未变化的文件不重写（避免IDE和构建工具重新索引）
+
+    参数:
+        files (dict): {文件路径: 文件内容}
+        max_workers (int): 写入线程数
+
+    返回:
+        tuple: (写入的文件列表, 未变化的文件列表)
+    """
+    if not files:
+        return [], []
+
+    paths = list(files)
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        changed = list(pool.map(lambda path: _write_if_changed(path, files[path]), paths))
+
+    written = [path for path, is_changed in zip(paths, changed) if is_changed]
+    unchanged = [path for path, is_changed in zip(paths, changed) if not is_changed]
+    return written, unchanged
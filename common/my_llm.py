@@ -1,4 +1,5 @@
 import os
+import threading
 from langchain_openai import ChatOpenAI
 from langchain_ollama.llms import OllamaLLM
 from dotenv import load_dotenv
@@ -26,12 +27,18 @@ def load_openai_api_key(key='OPENAI_API_KEY', dotenv_path=r'Z:\src\ai\ai_agent\.
 
 
 
-def get_language_model(model_type="qwen-coder-plus", temperature=0.1, timeout=60000):
+# 已构建的模型实例缓存，键为 (model_type, temperature, timeout)
+_model_registry = {}
+_registry_lock = threading.Lock()
+
+
+def _build_language_model(model_type, temperature, timeout):
     """
-    获取语言模型实例
+    按模型类型构建语言模型实例，只加载该模型需要的 API Key
 
     参数:
-        model_type (str): 模型类型，支持 "qwen-coder-plus"、"qwen2.5-coder"、"qwen2.5-coder-14b"、"custom"
+        model_type (str): 模型类型
+        temperature (float): 温度
         timeout (int): 请求超时时间（秒）
 
     返回:
@@ -39,9 +46,6 @@ def get_language_model(model_type="qwen-coder-plus", temperature=0.1, timeout=60
     """
     # 设置请求超时时间
     requests_timeout = timeout
-    api_key_qwen = load_openai_api_key(key='OPENAI_API_KEY_QWEN', dotenv_path=r'/.env')
-    api_key_deepseek = load_openai_api_key(key='OPENAI_API_KEY_DEEPSEEK', dotenv_path=r'/.env')
-
 
     if model_type == "qwen-coder-plus":
         # DashScope API 的 qwen-coder-plus 模型
@@ -49,7 +53,7 @@ def get_language_model(model_type="qwen-coder-plus", temperature=0.1, timeout=60
             base_url="https://dashscope.aliyuncs.com/compatible-mode/v1",
             model="qwen-coder-plus",
             temperature=temperature,
-            openai_api_key= api_key_qwen,
+            openai_api_key=load_openai_api_key(key='OPENAI_API_KEY_QWEN', dotenv_path=r'/.env'),
             max_tokens=10000,
             request_timeout=requests_timeout
         )
@@ -72,7 +76,7 @@ def get_language_model(model_type="qwen-coder-plus", temperature=0.1, timeout=60
         return ChatOpenAI(
             base_url="https://api.deepseek.com/v1",  # DeepSeek API端点
             model="deepseek-chat",  # DeepSeek模型标识
-            openai_api_key= api_key_deepseek,  # 替换为DeepSeek密钥
+            openai_api_key=load_openai_api_key(key='OPENAI_API_KEY_DEEPSEEK', dotenv_path=r'/.env'),
             max_tokens=100000,  # 考虑大文件10万token
             temperature=temperature,
         )
@@ -86,6 +90,45 @@ def get_language_model(model_type="qwen-coder-plus", temperature=0.1, timeout=60
         )
 
 
-# 获取语言模型实例 - 默认使用 qwen2.5-coder-14b 本地模型
-# language_model = get_language_model("qwen2.5-coder-14b", timeout=600)
-language_model = get_language_model("qwen-coder-plus", timeout=600 ,temperature=0.2)
\ No newline at end of file
+def get_language_model(model_type="qwen-coder-plus", temperature=0.1, timeout=60000):
+    """
+    获取语言模型实例
+
+    首次调用时才构建模型，之后按 (model_type, temperature, timeout) 复用同一个实例，
+    同一配置共享一个客户端（及其 HTTP 连接池）。
+
+    参数:
+        model_type (str): 模型类型，支持 "qwen-coder-plus"、"qwen2.5-coder"、"qwen2.5-coder-14b"、"custom"
+        timeout (int): 请求超时时间（秒）
+
+    返回:
+        语言模型实例
+    """
+    key = (model_type, temperature, timeout)
+    model = _model_registry.get(key)
+    if model is not None:
+        return model
+
+    with _registry_lock:
+        model = _model_registry.get(key)
+        if model is None:
+            model = _build_language_model(model_type, temperature, timeout)
+            _model_registry[key] = model
+    return model
+
+
+def clear_language_models():
+    """清空已缓存的模型实例（如修改了 .env 后需要重新构建）"""
+    with _registry_lock:
+        _model_registry.clear()
+
+
+def __getattr__(name):
+    """
+    延迟创建默认模型 language_model，import 本模块时不再构建任何客户端
+    """
+    if name == "language_model":
+        # 获取语言模型实例 - 默认使用 qwen2.5-coder-14b 本地模型
+        # return get_language_model("qwen2.5-coder-14b", timeout=600)
+        return get_language_model("qwen-coder-plus", timeout=600, temperature=0.2)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
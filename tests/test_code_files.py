@@ -0,0 +1,40 @@
+from common.code_files import split_code_blocks, safe_join, write_files
+
+import pytest
+
+
+def test_file_name_sources():
+    text = (
+        "### 1. UserController.java\n```java\nclass UserController {}\n```\n"
+        "**views/User.vue**\n```vue\n<template/>\n```\n"
+        "```xml:src/main/resources/mapper/UserMapper.xml\n<mapper/>\n```\n"
+        "```js\n// api/user.js\nexport const a = 1\n```\n"
+        "```java\nclass NoName {}\n```\n"
+    )
+    assert split_code_blocks(text) == [
+        ("UserController.java", "class UserController {}\n"),
+        ("views/User.vue", "<template/>\n"),
+        ("src/main/resources/mapper/UserMapper.xml", "<mapper/>\n"),
+        ("api/user.js", "// api/user.js\nexport const a = 1\n"),
+    ]
+
+
+def test_prose_mentioning_file_is_not_a_label():
+    text = "修改 pom.xml 后执行以下命令：\n```bash\nmvn clean package\n```\n"
+    assert split_code_blocks(text) == []
+
+
+def test_shell_block_does_not_overwrite_other_file_types():
+    text = "### pom.xml\n```bash\nmvn clean package\n```\n### build.sh\n```bash\nmvn package\n```\n"
+    assert split_code_blocks(text) == [("build.sh", "mvn package\n")]
+
+
+def test_safe_join_rejects_traversal(tmp_path):
+    with pytest.raises(ValueError):
+        safe_join(str(tmp_path), "../../etc/passwd")
+
+
+def test_write_files_skips_unchanged(tmp_path):
+    files = {str(tmp_path / "a" / "A.java"): "class A {}\n"}
+    assert write_files(files) == (list(files), [])
+    assert write_files(files) == ([], list(files))
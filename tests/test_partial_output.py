@@ -0,0 +1,57 @@
+import asyncio
+import importlib.util
+from pathlib import Path
+
+import pytest
+
+for dependency in ("yaml", "httpx", "langchain_core", "langchain_openai", "langchain_ollama"):
+    pytest.importorskip(dependency)
+
+_MAIN_PATH = Path(__file__).resolve().parents[1] / "10_构建迷你版生成代码工作流" / "workflow" / "main.py"
+_spec = importlib.util.spec_from_file_location("workflow_main", _MAIN_PATH)
+workflow_main = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(workflow_main)
+
+DESIGN = (
+    "# 设计文档\n"
+    "## API列表\n"
+    "- GET /api/users\n"
+    "```yaml\n"
+    "# 分页参数\n"
+    "page: 1\n"
+    "```\n"
+    "- POST /api/users\n"
+    "- DELETE /api/users/{id}\n"
+    "## 数据库设计\n"
+    "user 表\n"
+)
+
+
+async def _stream_select(spec, text, chunk_size):
+    stream = workflow_main.StepStream()
+
+    async def produce():
+        for start in range(0, len(text), chunk_size):
+            await stream.append(text[start:start + chunk_size])
+            await asyncio.sleep(0)
+        await stream.finish()
+
+    producer = asyncio.create_task(produce())
+    selected = await stream.wait_for(workflow_main._PartialOutputSelector(spec))
+    await producer
+    return selected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, len(DESIGN)])
+def test_section_skips_comments_in_code_blocks(chunk_size):
+    selected = asyncio.run(_stream_select({"section": "API列表"}, DESIGN, chunk_size))
+    assert selected == (
+        "## API列表\n- GET /api/users\n```yaml\n# 分页参数\npage: 1\n```\n"
+        "- POST /api/users\n- DELETE /api/users/{id}"
+    )
+
+
+def test_comment_in_code_block_does_not_start_section():
+    text = "## 说明\n~~~bash\n# 数据库设计\necho hi\n~~~\n## 数据库设计\nuser 表\n"
+    assert asyncio.run(_stream_select({"section": "数据库设计"}, text, 3)) == "## 数据库设计\nuser 表"
+